@@ -1,2 +1,5 @@
 __version__ = '0.6.0'
+from .aio import get_scansion_async  # noqa
 from .core import get_scansion  # noqa
+from .core import get_scansion_batch  # noqa
+from .core import iter_scansion  # noqa
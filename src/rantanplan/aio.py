@@ -0,0 +1,130 @@
+"""
+Asynchronous scansion for asyncio applications.
+
+Tagging and scansion are CPU bound, so they run on an executor instead of
+blocking the event loop. Threads share the pipeline already loaded by
+`load_pipeline` and take turns to tag, since a spaCy pipeline is not safe to
+use from several threads at once, while every process of a pool made with
+`make_executor` loads it once when it starts. Cancelling a call or reaching its timeout
+stops waiting for it, but a scansion already running on a worker is not
+interrupted.
+"""
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from .core import scan_token_records
+from .core import tag_texts_locked
+from .pipeline import load_pipeline
+
+
+def make_executor(workers=None, processes=False):
+    """Creates an executor for the asynchronous scansion functions
+
+    :param workers: Number of workers. Defaults to the executor default
+    :param processes: `True` for a pool of processes that load the pipeline
+        when they start, or `False` for a pool of threads
+    :return: The executor
+    :rtype: concurrent.futures.Executor
+    """
+    if processes:
+        return ProcessPoolExecutor(workers, initializer=load_pipeline)
+    return ThreadPoolExecutor(workers)
+
+
+async def get_scansion_async(text, executor=None, timeout=None, **options):
+    """Generates the scansion of a text on an executor
+
+    :param text: Full text to be analyzed
+    :param executor: Executor to run the scansion on. Defaults to the default
+        executor of the event loop
+    :param timeout: Maximum number of seconds to wait for the scansion.
+        Defaults to None for no limit
+    :param options: Keyword arguments for `get_scansion`
+    :return: list of dictionaries per line
+        (or list of list of dictionaries if split on stanzas)
+    :rtype: list
+    """
+    loop = asyncio.get_running_loop()
+    scansions = await asyncio.wait_for(
+        loop.run_in_executor(executor, _get_scansion_chunk, [text], options),
+        timeout)
+    return scansions[0]
+
+
+def _get_scansion_chunk(texts, options):
+    """Generates the scansion of a chunk of texts inside a worker. Texts are
+    tagged holding the tagging lock of the process, so only their scansion
+    runs in several threads at once
+
+    :param texts: List of texts to be analyzed
+    :param options: Dictionary with the options for `get_scansion_batch`
+    :return: List with the scansion of each text
+    :rtype: list
+    """
+    options = dict(options)
+    tagged = tag_texts_locked(
+        texts, options.get("split_stanzas_on"),
+        options.pop("chunk_size", None),
+        batch_size=options.pop("batch_size", 1000),
+        n_process=options.pop("n_process", 1),
+    )
+    return [scan_token_records(stanzas, **options) for stanzas in tagged]
+
+
+async def _iter_chunks(texts, texts_per_chunk):
+    """Groups the texts of an iterable or asynchronous iterable in lists"""
+    if hasattr(texts, "__aiter__"):
+        chunk = []
+        async for text in texts:
+            chunk.append(text)
+            if len(chunk) == texts_per_chunk:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+    else:
+        texts = iter(texts)
+        chunk = list(islice(texts, texts_per_chunk))
+        while chunk:
+            yield chunk
+            chunk = list(islice(texts, texts_per_chunk))
+
+
+async def get_scansion_batch_async(texts, executor=None, timeout=None,
+                                   texts_per_chunk=100, max_pending_chunks=2,
+                                   **options):
+    """Generates the scansion of several texts on an executor, tagging them
+    in chunks as `get_scansion_batch` does
+
+    :param texts: Iterable or asynchronous iterable of full texts to be
+        analyzed
+    :param executor: Executor to run the scansion on. Defaults to the default
+        executor of the event loop
+    :param timeout: Maximum number of seconds to wait for the scansion of
+        each chunk. Defaults to None for no limit
+    :param texts_per_chunk: Number of texts sent to the executor at once
+    :param max_pending_chunks: Maximum number of chunks being processed or
+        waiting to be yielded at any time
+    :param options: Keyword arguments for `get_scansion_batch`
+    :return: Asynchronous generator with the scansion of each text in input
+        order, as returned by `get_scansion`
+    :rtype: async_generator
+    """
+    loop = asyncio.get_running_loop()
+    pending = []
+    try:
+        async for chunk in _iter_chunks(texts, texts_per_chunk):
+            pending.append(loop.run_in_executor(
+                executor, _get_scansion_chunk, chunk, options))
+            if len(pending) >= max_pending_chunks:
+                for scansion in await asyncio.wait_for(pending.pop(0),
+                                                       timeout):
+                    yield scansion
+        while pending:
+            for scansion in await asyncio.wait_for(pending.pop(0), timeout):
+                yield scansion
+    finally:
+        for future in pending:
+            future.cancel()
@@ -0,0 +1,87 @@
+"""
+Benchmark of the pipeline profiles.
+
+Every profile is measured in a new process, so the memory taken by one of
+them is not counted for the others. Besides the speed and memory, a digest
+of the scansion of the texts is reported to check that every profile gives
+the same output.
+"""
+import hashlib
+import json
+import time
+from multiprocessing import get_context
+
+from .core import get_scansion_batch
+from .pipeline import PROFILES
+from .pipeline import get_memory_usage
+from .pipeline import get_profile
+from .pipeline import get_snapshot_key
+from .pipeline import load_pipeline
+from .pipeline import set_default_profile
+from .pipeline import set_default_snapshot
+
+
+def benchmark_profile(texts, profile="full", snapshot=None):
+    """Measures the pipeline of a profile in the current process
+
+    :param texts: List of texts to tag and scan
+    :param profile: Name of the profile of the pipeline
+    :param snapshot: Directory of a pipeline snapshot to restore instead of
+        building the pipeline of the profile. The profile is then the one the
+        snapshot was saved with
+    :return: Dictionary with the profile, the snapshot, the seconds it takes
+        to load, the resident memory it adds to the process and the total
+        after scanning the texts (in bytes, None if unknown), the tokens
+        tagged per second and the SHA-256 digest of the scansion of the texts
+    :rtype: dict
+    """
+    if snapshot is not None:
+        profile = get_profile(get_snapshot_key(snapshot)[2])
+    if profile is not None:
+        set_default_profile(profile)
+    # The scansion below loads the default pipeline, which is the snapshot
+    set_default_snapshot(snapshot)
+    memory_before = get_memory_usage()
+    start = time.perf_counter()
+    nlp = load_pipeline()
+    load_seconds = time.perf_counter() - start
+    memory_after = get_memory_usage()
+    start = time.perf_counter()
+    tokens = sum(len(doc) for doc in nlp.pipe(texts))
+    tag_seconds = time.perf_counter() - start
+    digest = hashlib.sha256()
+    for scansion in get_scansion_batch(texts):
+        digest.update(json.dumps(scansion, sort_keys=True).encode("utf-8"))
+    if memory_before is None or memory_after is None:
+        pipeline_memory = None
+    else:
+        pipeline_memory = memory_after - memory_before
+    return {
+        "profile": profile,
+        "snapshot": snapshot,
+        "load_seconds": load_seconds,
+        "pipeline_memory": pipeline_memory,
+        "memory": get_memory_usage(),
+        "tokens": tokens,
+        "tokens_per_second": tokens / tag_seconds if tag_seconds else None,
+        "scansion_digest": digest.hexdigest(),
+    }
+
+
+def benchmark_profiles(texts, profiles=tuple(PROFILES), snapshots=()):
+    """Measures the pipelines of several profiles and snapshots, each in a
+    new process
+
+    :param texts: List of texts to tag and scan
+    :param profiles: Names of the profiles to measure
+    :param snapshots: Directories of the pipeline snapshots to measure
+    :return: Generator with the result of `benchmark_profile` for each profile
+        and snapshot
+    :rtype: generator
+    """
+    context = get_context("spawn")
+    runs = [(profile, None) for profile in profiles]
+    runs += [("full", snapshot) for snapshot in snapshots]
+    for profile, snapshot in runs:
+        with context.Pool(1) as pool:
+            yield pool.apply(benchmark_profile, (texts, profile, snapshot))
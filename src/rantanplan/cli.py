@@ -14,10 +14,358 @@ Why does this file exist, and why not put this in __main__?
 
   Also see (1) from http://click.pocoo.org/5/setuptools/#setuptools-integration
 """
+import bz2
+import glob
+import gzip
+import json
+import lzma
+import os
+import signal
+import sys
+from collections import deque
+
 import click
 
+from .benchmark import benchmark_profiles
+from .core import get_scansion
+from .core import get_scansion_batch
+from .daemon import SOCKET_PATH
+from .daemon import get_scansion_remote
+from .daemon import serve as serve_daemon
+from .parallel import scan_corpus
+from .parallel import scan_corpus_staged
+from .pipeline import PROFILES
+from .pipeline import get_profile
+from .pipeline import get_snapshot_key
+from .pipeline import load_pipeline
+from .pipeline import save_pipeline_snapshot
+from .pipeline import set_default_profile
+from .pipeline import set_default_snapshot
+from .records import read_conllu
+from .service import MAX_BATCH_SIZE
+from .service import MAX_WAIT_MS
+from .service import PORT
+from .service import serve as serve_http
+
+STDIN = "-"
+
+COMPRESSED_OPENERS = {
+    ".gz": gzip.open,
+    ".bz2": bz2.open,
+    ".xz": lzma.open,
+}
+
+
+def open_input(path):
+    """Opens an input file for reading as text, decompressing it on the fly
+    if its extension is .gz, .bz2 or .xz
+
+    :param path: Path of the file, or "-" for the standard input
+    :return: File object
+    :rtype: io.TextIOBase
+    """
+    if path == STDIN:
+        return click.open_file(STDIN, encoding="utf-8")
+    opener = COMPRESSED_OPENERS.get(os.path.splitext(path)[1].lower(), open)
+    return opener(path, "rt", encoding="utf-8")
+
+
+def iter_paths(paths):
+    """Expands a list of files, directories and glob patterns into the
+    paths of the files to read. Directories are walked recursively
+
+    :param paths: List of paths. No paths or "-" for the standard input
+    :return: Generator with the path of each file
+    :rtype: generator
+    """
+    if not paths:
+        paths = [STDIN]
+    for path in paths:
+        if path == STDIN or os.path.isfile(path):
+            yield path
+        elif os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for file in sorted(files):
+                    yield os.path.join(root, file)
+        else:
+            matches = sorted(glob.glob(path, recursive=True))
+            if not matches:
+                raise click.BadParameter(f"No such file or directory: {path}",
+                                         param_hint="PATHS")
+            yield from iter_paths(matches)
+
+
+def iter_poems(lines, delimiter=None):
+    """Splits the lines of a text into poems, reading one line at a time
+
+    :param lines: Iterable of lines of text
+    :param delimiter: Line that separates consecutive poems. Defaults to None
+        for a single poem
+    :return: Generator with the text of each poem
+    :rtype: generator
+    """
+    poem = []
+    for line in lines:
+        if delimiter is not None and line.strip() == delimiter:
+            if poem:
+                yield "".join(poem).strip()
+            poem = []
+        else:
+            poem.append(line)
+    if poem and "".join(poem).strip():
+        yield "".join(poem).strip()
+
+
+def _set_profile(ctx, param, value):
+    if value is not None:
+        set_default_profile(value)
+
+
+profile_option = click.option(
+    "--profile", type=click.Choice(list(PROFILES)), default=None,
+    expose_value=False, callback=_set_profile,
+    help="Pipeline profile. The slim profile skips the components the "
+         "scansion does not use.")
+
+
+def _load_snapshot(ctx, param, value):
+    if value is not None:
+        profile = get_profile(get_snapshot_key(value)[2])
+        if profile is not None:
+            set_default_profile(profile)
+        set_default_snapshot(value)
+        load_pipeline()
+
+
+snapshot_option = click.option(
+    "--snapshot", type=click.Path(exists=True, file_okay=False),
+    default=None, expose_value=False, callback=_load_snapshot,
+    help="Directory of a pipeline snapshot to restore instead of building "
+         "the pipeline.")
+
+
+class DefaultCommandGroup(click.Group):
+    """Group of commands that runs a default command when the first argument
+    is not the name of one of its commands"""
+
+    def __init__(self, *args, default_command=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.default_command = default_command
+
+    def parse_args(self, ctx, args):
+        if not args or (args[0] not in self.commands and args[0] != "--help"):
+            args = [self.default_command, *args]
+        return super().parse_args(ctx, args)
+
+
+@click.group(cls=DefaultCommandGroup, default_command="scan")
+def main():
+    """Metrical and rhyme analysis of Spanish poetry. Runs the scan command
+    unless another command is given."""
+
+
+@main.command()
+@click.argument("paths", nargs=-1)
+@click.option("-o", "--output", type=click.File("w", encoding="utf-8"),
+              default=STDIN, help="File to write the JSON Lines output to.")
+@click.option("-d", "--delimiter", default=None,
+              help="Line that separates poems. By default, every input is a "
+                   "single poem.")
+@click.option("--conllu", is_flag=True, default=False,
+              help="Read poems already tagged in CoNLL-U, one per document, "
+                   "and scan them without loading the pipeline.")
+@click.option("--workers", type=click.IntRange(min=1), default=None,
+              help="Number of worker processes. Defaults to 1.")
+@click.option("--tagging-workers", type=click.IntRange(min=1), default=None,
+              help="Number of processes tagging the poems, so the worker "
+                   "processes only scan them.")
+@click.option("--batch-size", type=click.IntRange(min=1), default=None,
+              help="Number of poems tagged per batch. Defaults to 1000.")
+@click.option("--preload/--no-preload", default=False, show_default=True,
+              help="Load the pipeline before forking the workers so they "
+                   "share its memory.")
+@click.option("--report-memory", is_flag=True, default=False,
+              help="Write the memory of every worker to the standard error "
+                   "when done.")
+@click.option("--rhyme/--no-rhyme", default=False, show_default=True,
+              help="Perform rhyme analysis.")
+@click.option("--rhythm-format", default="pattern", show_default=True,
+              type=click.Choice(["pattern", "binary", "indexed"]),
+              help="Output format of the rhythm.")
+@click.option("--split-stanzas-on", default=None,
+              help="Regular expression to split poems in stanzas.")
+@click.option("--socket", "socket_path", default=None,
+              help="Send the poems to the daemon listening on this Unix "
+                   "socket instead of loading the pipeline.")
+@profile_option
+@snapshot_option
+def scan(paths, output, delimiter, conllu, workers, tagging_workers,
+         batch_size, preload, report_memory, rhyme, rhythm_format,
+         split_stanzas_on, socket_path):
+    """Scans the poems in PATHS, which can be files (optionally compressed
+    with gzip, bzip2 or xz), directories or glob patterns, and writes a JSON
+    object per poem. Poems are read from the standard input if no PATHS are
+    given or PATHS is "-"."""
+    if conllu and socket_path is not None:
+        raise click.UsageError("--conllu and --socket can not be used "
+                               "together")
+    if conllu or socket_path is not None:
+        # Poems are neither tagged nor scanned in this process
+        ignored = {
+            "--workers": workers is not None,
+            "--tagging-workers": tagging_workers is not None,
+            "--batch-size": batch_size is not None,
+            "--preload": preload,
+            "--report-memory": report_memory,
+            "--delimiter": conllu and delimiter is not None,
+        }
+        ignored = [option for option, given in ignored.items() if given]
+        if ignored:
+            raise click.UsageError(
+                f"{', '.join(ignored)} can not be used with "
+                f"{'--conllu' if conllu else '--socket'}")
+    elif (preload or report_memory) and (
+            tagging_workers is not None or (workers or 1) == 1):
+        raise click.UsageError("--preload and --report-memory need more "
+                               "than one --workers and no --tagging-workers")
+    if workers is None:
+        workers = 1
+    if batch_size is None:
+        batch_size = 1000
+    sources = deque()
+
+    def poems():
+        for path in iter_paths(paths):
+            with open_input(path) as lines:
+                if conllu:
+                    documents = read_conllu(lines)
+                else:
+                    documents = iter_poems(lines, delimiter)
+                for index, poem in enumerate(documents):
+                    sources.append((path, index))
+                    yield poem
+
+    options = dict(
+        rhyme_analysis=rhyme,
+        rhythm_format=rhythm_format,
+        split_stanzas_on=split_stanzas_on,
+    )
+    if conllu:
+        scansions = (get_scansion(poem, **options) for poem in poems())
+    elif socket_path is not None:
+        scansions = get_scansion_remote(poems(), socket_path, **options)
+    elif tagging_workers is not None:
+        scansions = scan_corpus_staged(
+            poems(), tagging_workers=tagging_workers,
+            scansion_workers=workers, batch_size=batch_size, **options)
+    elif workers == 1:
+        scansions = get_scansion_batch(poems(), batch_size=batch_size,
+                                       **options)
+    else:
+        memory_report = {} if report_memory else None
+        scansions = scan_corpus(poems(), workers=workers,
+                                batch_size=batch_size, preload=preload,
+                                memory_report=memory_report, **options)
+    # Sources are always registered before their poems are scanned
+    try:
+        for scansion in scansions:
+            source, index = sources.popleft()
+            output.write(json.dumps({
+                "source": source,
+                "index": index,
+                "scansion": scansion,
+            }, ensure_ascii=False))
+            output.write("\n")
+    except ConnectionError as error:
+        raise click.ClickException(str(error))
+    if report_memory:
+        for memory in memory_report.values():
+            click.echo(json.dumps(memory), err=True)
+
+
+@main.command()
+@click.option("--socket", "socket_path", default=SOCKET_PATH,
+              show_default=True, help="Unix socket to listen on.")
+@profile_option
+@snapshot_option
+def serve(socket_path):
+    """Keeps the pipeline loaded and serves scansion requests on a Unix
+    socket, for scan --socket to use."""
+    click.echo(f"Listening on {socket_path}", err=True)
+    # Exit cleanly on SIGTERM so the socket file is removed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        serve_daemon(socket_path)
+    except FileExistsError as error:
+        raise click.ClickException(str(error))
+    except KeyboardInterrupt:
+        pass
+
+
+@main.command("serve-http")
+@click.option("--port", type=int, default=PORT, show_default=True,
+              help="TCP port to listen on localhost.")
+@click.option("--max-batch-size", type=click.IntRange(min=1),
+              default=MAX_BATCH_SIZE, show_default=True,
+              help="Maximum number of requests tagged together.")
+@click.option("--max-wait-ms", type=click.FloatRange(min=0),
+              default=MAX_WAIT_MS, show_default=True,
+              help="Maximum time a request waits for a batch to fill up.")
+@click.option("--workers", type=click.IntRange(min=1), default=None,
+              help="Number of workers scanning the tagged requests.")
+@click.option("--processes", is_flag=True,
+              help="Scan in worker processes instead of threads, so the "
+                   "requests of a batch are scanned in parallel.")
+@profile_option
+@snapshot_option
+def serve_http_command(port, max_batch_size, max_wait_ms, workers, processes):
+    """Serves scansion requests over HTTP on localhost, tagging concurrent
+    requests in micro-batches."""
+    click.echo(f"Listening on http://localhost:{port}", err=True)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        serve_http(port, max_batch_size, max_wait_ms, workers, processes)
+    except KeyboardInterrupt:
+        pass
+
+
+@main.command()
+@click.argument("paths", nargs=-1)
+@click.option("-d", "--delimiter", default=None,
+              help="Line that separates poems. By default, every input is a "
+                   "single poem.")
+@click.option("--profile", "profiles", type=click.Choice(list(PROFILES)),
+              multiple=True,
+              help="Profile to measure. Defaults to all if no snapshots.")
+@click.option("--snapshot", "snapshots", multiple=True,
+              type=click.Path(exists=True, file_okay=False),
+              help="Pipeline snapshot to measure.")
+def benchmark(paths, delimiter, profiles, snapshots):
+    """Measures the load time, memory and tagging speed of the pipeline
+    profiles and snapshots on the poems in PATHS, and checks they give the
+    same scansion. Fails if they do not."""
+    texts = []
+    for path in iter_paths(paths):
+        with open_input(path) as lines:
+            texts.extend(iter_poems(lines, delimiter))
+    digests = set()
+    if not profiles and not snapshots:
+        profiles = tuple(PROFILES)
+    for result in benchmark_profiles(texts, profiles, snapshots):
+        click.echo(json.dumps(result))
+        digests.add(result["scansion_digest"])
+    if len(digests) > 1:
+        raise click.ClickException("The profiles give different scansions")
+
 
-@click.command()
-@click.argument('names', nargs=-1)
-def main(names):
-    click.echo(repr(names))
+@main.command()
+@click.argument("path", type=click.Path(file_okay=False))
+@click.option("--profile", type=click.Choice(list(PROFILES)), default=None,
+              help="Pipeline profile.")
+@click.option("--split-affixes/--no-split-affixes", default=True,
+              show_default=True, help="Split verbs and their clitics.")
+def snapshot(path, profile, split_affixes):
+    """Saves the pipeline, fully built, to the directory PATH so it can be
+    restored quickly with --snapshot."""
+    save_pipeline_snapshot(path, split_affixes=split_affixes, profile=profile)
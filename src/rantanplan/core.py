@@ -8,12 +8,20 @@
 # https://www.raco.cat/index.php/Elies/article/view/194843
 # http://elies.rediris.es/elies4/Fon2.htm
 # http://elies.rediris.es/elies4/Fon8.htm
+import json
 import re
-from itertools import product
+from bisect import bisect_left
+from collections import OrderedDict
+from collections import deque
+from collections import namedtuple
+from functools import lru_cache
+from threading import Lock
 
 from spacy.tokens import Doc
+from spacy.tokens import Span
 
 from .pipeline import load_pipeline
+from .records import get_token_records
 from .rhymes import analyze_rhyme
 from .structures import STRUCTURES_LENGTH
 from .syllabification import ALTERNATIVE_SYLLABIFICATION
@@ -212,12 +220,25 @@ def get_stresses(phonological_groups):
         stressed (`True`) or not (`False`)
     :rtype: list
     """
-    stresses = []
-    last_word_syllables = []
-    for group in phonological_groups:
-        stresses.append(group["is_stressed"])
-    for group in phonological_groups:
-        last_word_syllables.append(group.get("is_word_end", False))
+    return adjust_stresses(
+        [group["is_stressed"] for group in phonological_groups],
+        [group.get("is_word_end", False) for group in phonological_groups],
+    )
+
+
+def adjust_stresses(stresses, last_word_syllables):
+    """Adds or removes the last stress mark of a line depending on the ending
+    stress.
+
+    :param stresses: List of boolean values indicating whether each
+        phonological group is stressed (`True`) or not (`False`)
+    :param last_word_syllables: List of boolean values indicating whether each
+        phonological group is the end of a word (`True`) or not (`False`)
+    :return: List of boolean values indicating whether a group is
+        stressed (`True`) or not (`False`)
+    :rtype: list
+    """
+    stresses = list(stresses)
     # Get position for the last syllable of the penultimate word
     if last_word_syllables.count(True) > 1:
         penultimate_word = -(
@@ -331,7 +352,52 @@ def apply_exception_rules_post(word):
     return word
 
 
-def syllabify(word, alternative_syllabification=False):
+# Maximum number of letter windows kept in the letter clusters table
+LETTER_CLUSTERS_TABLE_SIZE = 2 ** 17
+# Maps windows of up to 4 letters, the longest letter cluster, to whether the
+# first matching letter clusters pattern adds a hyphen, or `None` if no
+# pattern matches
+_letter_clusters_table = {}
+
+
+def hyphenate_letter_clusters(word):
+    """Adds a hyphen after every letter of a word that closes a syllable
+    according to the letter clusters patterns. The word is scanned once from
+    right to left and the outcome of the patterns for each window of letters
+    is looked up in a table that is filled as new windows are found
+
+    :param word: A presyllabified string
+    :return: A string with the hyphenated word
+    :rtype: str
+    """
+    table = _letter_clusters_table
+    letters = []
+    # Whether the first pattern matching from the current position onwards
+    # adds a hyphen, or `False` if no pattern matches
+    adds_hyphen = False
+    for index in range(len(word) - 1, -1, -1):
+        window = word[index:index + 4]
+        try:
+            window_hyphen = table[window]
+        except KeyError:
+            if len(table) >= LETTER_CLUSTERS_TABLE_SIZE:
+                table.clear()
+            match = letter_clusters_re.match(window)
+            # Adds hyphen to syllables if regex pattern is not 5, 8, 11
+            window_hyphen = table[window] = (
+                None if match is None else match.lastindex not in {5, 8, 11}
+            )
+        if window_hyphen is not None:
+            adds_hyphen = window_hyphen
+        letters.append(word[index] + "-" if adds_hyphen else word[index])
+    return "".join(reversed(letters))
+
+
+# Maximum number of words whose syllabification is memoized
+SYLLABIFY_CACHE_SIZE = 2 ** 16
+
+
+def _syllabify(word, alternative_syllabification=False):
     """Syllabifies a word.
 
     :param word: The word to be syllabified.
@@ -347,14 +413,7 @@ def syllabify(word, alternative_syllabification=False):
         output = SYLLABIFICATOR_FOREIGN_WORDS_DICT[word]
     else:
         word = apply_exception_rules(word)
-        while len(word) > 0:
-            output += word[0]
-            # Returns first matching pattern.
-            m = letter_clusters_re.search(word)
-            if m is not None:
-                # Adds hyphen to syllables if regex pattern is not 5, 8, 11
-                output += "-" if m.lastindex not in {5, 8, 11} else ""
-            word = word[1:]
+        output = hyphenate_letter_clusters(word)
         output = apply_exception_rules_post(output)
     # Remove empty elements created during syllabification
     output = list(filter(bool, output.split("-")))
@@ -366,6 +425,51 @@ def syllabify(word, alternative_syllabification=False):
                 ALTERNATIVE_SYLLABIFICATION.get(original_word, (None, ()))[1])
 
 
+_syllabify_cached = lru_cache(maxsize=SYLLABIFY_CACHE_SIZE)(_syllabify)
+
+
+def syllabify(word, alternative_syllabification=False):
+    """Syllabifies a word. Results are memoized on a bounded LRU cache keyed
+    on the word and the alternative syllabification flag.
+
+    :param word: The word to be syllabified.
+    :param alternative_syllabification: Wether or not the alternative
+        syllabification is used
+    :return: List of syllables and exceptions where appropriate.
+    :rtype: list
+    """
+    syllables, exceptions = _syllabify_cached(word,
+                                              alternative_syllabification)
+    # Return a copy so callers can not modify the memoized syllables
+    return list(syllables), exceptions
+
+
+def set_syllabify_cache_size(size):
+    """Sets the maximum number of memoized syllabifications, clearing the
+    current cache
+
+    :param size: Maximum number of words to memoize. `None` for no limit and
+        0 to disable memoization
+    """
+    global _syllabify_cached
+    _syllabify_cached = lru_cache(maxsize=size)(_syllabify)
+
+
+def clear_syllabify_cache():
+    """Removes all the memoized syllabifications and resets the statistics"""
+    _syllabify_cached.cache_clear()
+
+
+def syllabify_cache_info():
+    """Gets the statistics of the syllabification cache
+
+    :return: Named tuple with the hits, misses, maxsize and currsize of the
+        cache
+    :rtype: functools._CacheInfo
+    """
+    return _syllabify_cached.cache_info()
+
+
 def get_orthographic_accent(syllable_list):
     """Given a list of str representing syllables,
     return position in the list of a syllable bearing
@@ -650,21 +754,237 @@ def join_affixes(line, pos_output=False):
     return syllabified_words if syllabified_words else line
 
 
+# Default maximum number of lines in the line cache
+LINE_CACHE_SIZE = 2 ** 16
+
+LineCacheInfo = namedtuple("LineCacheInfo", "hits misses maxsize currsize")
+
+_line_cache = OrderedDict()
+_line_cache_lock = Lock()
+_line_cache_info = {"hits": 0, "misses": 0, "maxsize": 0}
+
+
+def get_line_cache_key(tokens, rhythm_format="pattern", rhyme_analysis=False,
+                       pos_output=False):
+    """Gets the key of a line in the line cache, made of the text and tags of
+    its tokens and the options that change its scansion
+
+    :param tokens: List of spaCy tokens of the line
+    :param rhythm_format: output format for rhythm analysis
+    :param rhyme_analysis: Specify if rhyme analysis is to be performed
+    :param pos_output: `True` or `False` for printing the PoS of the words
+    :return: Key of the line
+    :rtype: str
+    """
+    return json.dumps([
+        rhythm_format, rhyme_analysis, pos_output,
+        [[token.text, token.pos_, token.tag_,
+          token._.affixes_length if token.pos_ in ("AUX", "VERB") else None]
+         for token in tokens],
+    ], ensure_ascii=False)
+
+
+def get_line_scansion(tokens, rhythm_format="pattern", rhyme_analysis=False,
+                      pos_output=False):
+    """Generates the words, phonological groups and rhythm of a line. If the
+    line cache is enabled, the result for lines with the same tokens and tags
+    is only computed once
+
+    :param tokens: List of spaCy tokens of the line
+    :param rhythm_format: output format for rhythm analysis
+    :param rhyme_analysis: Specify if rhyme analysis is to be performed
+    :param pos_output: `True` or `False` for printing the PoS of the words
+    :return: Dictionary with the tokens, phonological groups and rhythm of the
+        line
+    :rtype: dict
+    """
+    if _line_cache_info["maxsize"] == 0:
+        return _get_line_scansion(tokens, rhythm_format, rhyme_analysis,
+                                  pos_output)
+    key = get_line_cache_key(tokens, rhythm_format, rhyme_analysis,
+                             pos_output)
+    with _line_cache_lock:
+        cached_line = _line_cache.get(key)
+        if cached_line is not None:
+            _line_cache.move_to_end(key)
+            _line_cache_info["hits"] += 1
+            # Decoding always returns a copy callers are free to modify
+            return json.loads(cached_line)
+        _line_cache_info["misses"] += 1
+    line = _get_line_scansion(tokens, rhythm_format, rhyme_analysis,
+                              pos_output)
+    with _line_cache_lock:
+        _line_cache[key] = json.dumps(line, ensure_ascii=False)
+        _trim_line_cache()
+    return line
+
+
+def _get_line_scansion(tokens, rhythm_format="pattern", rhyme_analysis=False,
+                       pos_output=False):
+    """Generates the words, phonological groups and rhythm of a line
+
+    :param tokens: List of spaCy tokens of the line
+    :param rhythm_format: output format for rhythm analysis
+    :param rhyme_analysis: Specify if rhyme analysis is to be performed
+    :param pos_output: `True` or `False` for printing the PoS of the words
+    :return: Dictionary with the tokens, phonological groups and rhythm of the
+        line
+    :rtype: dict
+    """
+    words = get_words(tokens, False, pos_output)
+    syllables = get_syllables_word_end(words)
+    # Groups without liaisons are the same dictionaries as the syllables of
+    # the words, so only joined groups are built here. The compact groups
+    # are only worth it in the length search, which builds many candidates
+    phonological_groups = get_phonological_groups(
+        get_phonological_groups(syllables, liaison_type="sinaeresis")
+    )
+    return {
+        "tokens": words,
+        "phonological_groups": phonological_groups,
+        "rhythm": get_rhythmical_pattern(phonological_groups,
+                                         rhythm_format,
+                                         rhyme_analysis=rhyme_analysis)
+    }
+
+
+def _trim_line_cache():
+    """Removes the least recently used lines over the size of the cache"""
+    maxsize = _line_cache_info["maxsize"]
+    if maxsize is not None:
+        while len(_line_cache) > maxsize:
+            _line_cache.popitem(last=False)
+
+
+def set_line_cache_size(size=LINE_CACHE_SIZE):
+    """Sets the maximum number of lines in the line cache, removing the least
+    recently used ones if needed. The line cache is disabled by default
+
+    :param size: Maximum number of lines to cache. `None` for no limit and 0
+        to disable the cache
+    """
+    with _line_cache_lock:
+        _line_cache_info["maxsize"] = size
+        _trim_line_cache()
+
+
+def clear_line_cache():
+    """Removes all the cached lines and resets the statistics"""
+    with _line_cache_lock:
+        _line_cache.clear()
+        _line_cache_info.update({"hits": 0, "misses": 0})
+
+
+def line_cache_info():
+    """Gets the statistics of the line cache
+
+    :return: Named tuple with the hits, misses, maxsize and currsize of the
+        cache
+    :rtype: LineCacheInfo
+    """
+    with _line_cache_lock:
+        return LineCacheInfo(currsize=len(_line_cache), **_line_cache_info)
+
+
+def save_line_cache(path):
+    """Saves the line cache to a JSON Lines file, from the least to the most
+    recently used line
+
+    :param path: Path of the file
+    """
+    with _line_cache_lock:
+        entries = list(_line_cache.items())
+    with open(path, "w", encoding="utf-8") as cache_file:
+        for key, line in entries:
+            cache_file.write(f'{{"key": {json.dumps(key)}, "line": {line}}}\n')
+
+
+def load_line_cache(path):
+    """Loads lines saved with `save_line_cache` into the line cache. Loaded
+    lines are considered the most recently used ones, and the least recently
+    used lines are removed if the cache gets full. The cache must be enabled
+    with `set_line_cache_size` to be used
+
+    :param path: Path of the file
+    """
+    with open(path, encoding="utf-8") as cache_file:
+        entries = [json.loads(entry) for entry in cache_file if entry.strip()]
+    with _line_cache_lock:
+        for entry in entries:
+            _line_cache[entry["key"]] = json.dumps(entry["line"],
+                                                   ensure_ascii=False)
+            _line_cache.move_to_end(entry["key"])
+        _trim_line_cache()
+
+
+# Maximum number of liaison combinations explored per line when adjusting its
+# length to the expected rhythmical length
+MAX_LIAISON_CANDIDATES = 10000
+
+
+def get_stanzas(tokens, split_stanzas_on, nlp=None):
+    """Splits tagged tokens in stanzas where a regular expression matches
+    their text, so a text split in stanzas is only tagged once
+
+    :param tokens: spaCy `Doc` or list of token records
+    :param split_stanzas_on: String or regular expression to split the text
+        of the tokens in stanzas
+    :param nlp: Pipeline to tag every stanza on its own when a match does not
+        start and end between tokens. Defaults to None for raising an error
+    :return: List with the tokens of each stanza, as `Span` for Docs
+    :rtype: list
+    """
+    starts = []
+    boundaries = set()
+    text = []
+    offset = 0
+    for token in tokens:
+        starts.append(offset)
+        boundaries.update((offset, offset + len(token.text)))
+        text += [token.text, token.whitespace_]
+        offset += len(token.text) + len(token.whitespace_)
+    text = "".join(text)
+    boundaries.add(len(text))
+    stanzas = []
+    start = 0
+    for match in re.finditer(split_stanzas_on, text):
+        if match.start() not in boundaries or match.end() not in boundaries:
+            if nlp is None:
+                raise ValueError(
+                    f"Stanzas split at {match.start()} inside a token")
+            return list(nlp.pipe(re.split(split_stanzas_on, text)))
+        stanzas.append((start, match.start()))
+        start = match.end()
+    stanzas.append((start, len(text)))
+    # Tokens belong to the stanza they start in, separators are left out
+    return [tokens[bisect_left(starts, start):bisect_left(starts, end)]
+            for start, end in stanzas]
+
+
 def get_scansion(text, rhyme_analysis=False, rhythm_format="pattern",
                  rhythmical_lengths=None, split_stanzas_on=None,
-                 pos_output=False, always_return_rhyme=False):
+                 pos_output=False, always_return_rhyme=False,
+                 max_liaison_candidates=MAX_LIAISON_CANDIDATES,
+                 chunk_size=None):
     """Generates a list of dictionaries for each line
 
-    :param text: Full text to be analyzed
+    :param text: Full text to be analyzed, or its tokens already tagged as a
+        spaCy `Doc` or a list of token records
     :param rhyme_analysis: Specify if rhyme analysis is to be performed
     :param rhythm_format: output format for rhythm analysis
     :param rhythmical_lengths: List with explicit rhythmical lengths per line
         that the analysed lines has to meet
-    :param split_stanzas_on: Regular expression to split text in stanzas.
-        Defaults to None for not splitting.
+    :param split_stanzas_on: Regular expression to split text in stanzas,
+        which are sliced from the text tagged as a whole. Defaults to None
+        for not splitting.
     :param pos_output: `True` or `False` for printing the PoS of the words
     :param always_return_rhyme: `True` or `False` for printing rhyme pattern
         even if no structure is detected
+    :param max_liaison_candidates: Maximum number of liaison combinations to
+        explore per line to meet its rhythmical length. None for no limit
+    :param chunk_size: Maximum number of characters of text tagged at once.
+        Longer texts are tagged in chunks of whole lines, or of whole stanzas
+        if split. Defaults to None for the maximum length of the pipeline
     :return: list of dictionaries per line
         (or list of list of dictionaries if split on stanzas)
     :rtype: list
@@ -676,9 +996,20 @@ def get_scansion(text, rhyme_analysis=False, rhythm_format="pattern",
             rhythm_format=rhythm_format,
             rhythmical_lengths=rhythmical_lengths,
             pos_output=pos_output,
-            always_return_rhyme=always_return_rhyme
+            always_return_rhyme=always_return_rhyme,
+            max_liaison_candidates=max_liaison_candidates,
+            chunk_size=chunk_size,
         )
     else:
+        if isinstance(text, (Doc, list, tuple)):
+            stanzas = get_stanzas(text, split_stanzas_on)
+        else:
+            nlp = load_pipeline()
+            if chunk_size is None:
+                chunk_size = nlp.max_length
+            chunks = iter_text_chunks(text, chunk_size, split_stanzas_on)
+            stanzas = tag_stanzas(nlp.pipe(chunks, batch_size=1),
+                                  split_stanzas_on, nlp)
         return [
             _get_scansion(
                 text=stanza,
@@ -687,61 +1018,330 @@ def get_scansion(text, rhyme_analysis=False, rhythm_format="pattern",
                 rhythmical_lengths=rhythmical_lengths,
                 pos_output=pos_output,
                 always_return_rhyme=always_return_rhyme,
-            ) for stanza in re.compile(split_stanzas_on).split(text)
+                max_liaison_candidates=max_liaison_candidates,
+            ) for stanza in stanzas
         ]
 
 
-def _get_scansion(text, rhyme_analysis=False, rhythm_format="pattern",
-                  rhythmical_lengths=None, split_stanzas_on=None,
-                  pos_output=False, always_return_rhyme=False):
-    """Generates a list of dictionaries for each line
+def get_scansion_batch(texts, rhyme_analysis=False, rhythm_format="pattern",
+                       rhythmical_lengths=None, split_stanzas_on=None,
+                       pos_output=False, always_return_rhyme=False,
+                       batch_size=1000, n_process=1,
+                       max_liaison_candidates=MAX_LIAISON_CANDIDATES,
+                       chunk_size=None):
+    """Generates the scansion of several texts at once, tagging them in
+    batches with spaCy's `nlp.pipe`
 
-    :param text: Full text to be analyzed
+    :param texts: Iterable of full texts to be analyzed
     :param rhyme_analysis: Specify if rhyme analysis is to be performed
     :param rhythm_format: output format for rhythm analysis
     :param rhythmical_lengths: List with explicit rhythmical lengths per line
         that the analysed lines has to meet
-    :param split_stanzas_on: String or regular expression to split text in
-        stanzas. Defaults to None for not splitting.
+    :param split_stanzas_on: Regular expression to split texts in stanzas.
+        Defaults to None for not splitting.
     :param pos_output: `True` or `False` for printing the PoS of the words
     :param always_return_rhyme: `True` or `False` for printing rhyme pattern
         even if no structure is detected
-    :return: list of dictionaries per line
-    :rtype: list
+    :param batch_size: Number of texts to buffer for each spaCy batch
+    :param n_process: Number of processes spaCy uses to tag the texts
+    :param max_liaison_candidates: Maximum number of liaison combinations to
+        explore per line to meet its rhythmical length. None for no limit
+    :param chunk_size: Maximum number of characters of text tagged at once.
+        Longer texts are tagged in chunks of whole lines, or of whole stanzas
+        if split. Defaults to None for the maximum length of the pipeline
+    :return: Generator with the scansion of each text in input order, as
+        returned by `get_scansion`
+    :rtype: generator
+    """
+    options = dict(
+        rhyme_analysis=rhyme_analysis,
+        rhythm_format=rhythm_format,
+        rhythmical_lengths=rhythmical_lengths,
+        split_stanzas_on=split_stanzas_on,
+        pos_output=pos_output,
+        always_return_rhyme=always_return_rhyme,
+        max_liaison_candidates=max_liaison_candidates,
+    )
+    # Scanned from their records so every Doc is freed right away
+    for stanzas in tag_texts(texts, split_stanzas_on, chunk_size,
+                             batch_size=batch_size, n_process=n_process):
+        yield scan_token_records(stanzas, **options)
+
+
+def tag_stanzas(docs, split_stanzas_on, nlp=None):
+    """Splits tagged texts in stanzas and replaces their tokens by their
+    records, so every Doc can be freed as soon as it is split
+
+    :param docs: Iterable of spaCy `Doc` or lists of token records
+    :param split_stanzas_on: String or regular expression to split the texts
+        in stanzas. None for a single stanza per text
+    :param nlp: spaCy pipeline to tag again the stanzas of a `Doc` whose
+        separators fall inside a token
+    :return: Generator with the list of token records of each stanza
+    :rtype: generator
+    """
+    for doc in docs:
+        if split_stanzas_on is None:
+            stanzas = deque([get_token_records(doc)])
+        else:
+            stanzas = deque(
+                get_token_records(stanza)
+                for stanza in get_stanzas(doc, split_stanzas_on, nlp))
+        del doc
+        while stanzas:
+            yield stanzas.popleft()
+
+
+def get_token_lines(tokens):
+    """Groups tokens in lines of verse, which end at whitespace tokens with
+    a newline
+
+    :param tokens: spaCy `Doc` or sequence of tokens
+    :return: Generator with the list of tokens of each line, without the
+        whitespace tokens ending them
+    :rtype: generator
     """
-    if isinstance(text, Doc):
-        tokens = text
-    else:
-        nlp = load_pipeline()
-        tokens = nlp(text)
     seen_tokens = []
-    lines = []
-    raw_tokens = []
     # Handle multi-line sentences and create the line with words
     for token in tokens:
         if (token.pos_ == SPACE
                 and '\n' in token.orth_
                 and len(seen_tokens) > 0):
-            lines.append({"tokens": get_words(seen_tokens, False, pos_output)})
-            raw_tokens.append(seen_tokens)
+            yield seen_tokens
             seen_tokens = []
         else:
             seen_tokens.append(token)
     if len(seen_tokens) > 0:
-        lines.append({"tokens": get_words(seen_tokens, False, pos_output)})
-        raw_tokens.append(seen_tokens)
-    # Extract phonological groups and rhythm per line
-    for line in lines:
-        syllables = get_syllables_word_end(line["tokens"])
-        phonological_groups = get_phonological_groups(
-            get_phonological_groups(syllables, liaison_type="sinaeresis")
-        )
-        line.update({
-            "phonological_groups": phonological_groups,
-            "rhythm": get_rhythmical_pattern(phonological_groups,
-                                             rhythm_format,
-                                             rhyme_analysis=rhyme_analysis)
-        })
+        yield seen_tokens
+
+
+def iter_text_chunks(text, chunk_size, split_stanzas_on=None):
+    """Splits a text in chunks to be tagged separately, never inside a line
+    of verse. Chunks end right after the whitespace following a line, or
+    right before a stanza separator (which is then left out)
+
+    :param text: Full text to be split
+    :param chunk_size: Maximum number of characters of every chunk. Longer
+        lines or stanzas make up a chunk of their own
+    :param split_stanzas_on: String or regular expression to split text in
+        stanzas, for chunks of whole stanzas. Defaults to None for chunks of
+        whole lines
+    :return: Generator with the text of each chunk
+    :rtype: generator
+    """
+    if split_stanzas_on is None:
+        # A line and the whitespace after it, which holds a newline. The
+        # whitespace at the start of the text belongs to the first line
+        pieces = ((match.start(), match.end())
+                  for match in re.finditer(r"\s*[^\n]*(?:\n\s*|$)", text)
+                  if match.end() > match.start())
+    else:
+        pieces = []
+        start = 0
+        for match in re.finditer(split_stanzas_on, text):
+            pieces.append((start, match.start()))
+            start = match.end()
+        pieces.append((start, len(text)))
+    chunk_start = chunk_end = None
+    for start, end in pieces:
+        if chunk_start is not None and end - chunk_start > chunk_size:
+            yield text[chunk_start:chunk_end]
+            chunk_start = None
+        if chunk_start is None:
+            chunk_start = start
+        chunk_end = end
+    if chunk_start is not None:
+        yield text[chunk_start:chunk_end]
+
+
+def pipe_chunks(nlp, texts, split_stanzas_on=None, chunk_size=None,
+                **kwargs):
+    """Tags several texts at once with spaCy's `nlp.pipe`. Texts longer than
+    chunk_size are tagged in chunks of whole lines, or of whole stanzas if
+    split, as in `get_scansion`
+
+    :param nlp: spaCy pipeline
+    :param texts: Iterable of full texts to be analyzed
+    :param split_stanzas_on: String or regular expression to split the texts
+        in stanzas, for chunks of whole stanzas. Defaults to None for chunks
+        of whole lines
+    :param chunk_size: Maximum number of characters of text tagged at once.
+        Defaults to None for the maximum length of the pipeline
+    :param kwargs: Keyword arguments for `nlp.pipe`
+    :return: Generator with tuples of the index of a text and the `Doc` of
+        one of its chunks, in the order of the texts
+    :rtype: generator
+    """
+    if chunk_size is None:
+        chunk_size = nlp.max_length
+    indices = deque()
+
+    def iter_chunks():
+        for index, text in enumerate(texts):
+            if len(text) > chunk_size:
+                chunks = iter_text_chunks(text, chunk_size, split_stanzas_on)
+            else:
+                chunks = [text]
+            for chunk in chunks:
+                # Queued before the chunk is tagged, so it is always there
+                # when its Doc comes out
+                indices.append(index)
+                yield chunk
+
+    for doc in nlp.pipe(iter_chunks(), **kwargs):
+        yield indices.popleft(), doc
+
+
+def join_chunk_stanzas(stanzas, split_stanzas_on=None):
+    """Joins the token records of the chunks of a text tagged in chunks with
+    `pipe_chunks` and split with `tag_stanzas`
+
+    :param stanzas: List with the list of token records of each stanza of
+        every chunk, or of every chunk if the text is not split
+    :param split_stanzas_on: String or regular expression the text is split
+        in stanzas on. Defaults to None for not splitting
+    :return: List with the list of token records of each stanza, a single
+        one if the text is not split
+    :rtype: list
+    """
+    if split_stanzas_on is not None:
+        return stanzas
+    # Chunks end after the newline of their last line, so their records are
+    # simply joined
+    return [[record for chunk in stanzas for record in chunk]]
+
+
+def tag_texts(texts, split_stanzas_on=None, chunk_size=None, nlp=None,
+              **kwargs):
+    """Tags several texts at once, in chunks if they are too long, and
+    replaces their tokens by their records as soon as every chunk is tagged
+
+    :param texts: Iterable of full texts to be analyzed
+    :param split_stanzas_on: String or regular expression to split the texts
+        in stanzas. Defaults to None for not splitting
+    :param chunk_size: Maximum number of characters of text tagged at once.
+        Longer texts are tagged in chunks of whole lines, or of whole stanzas
+        if split. Defaults to None for the maximum length of the pipeline
+    :param nlp: spaCy pipeline. Defaults to None for `load_pipeline`
+    :param kwargs: Keyword arguments for `nlp.pipe`
+    :return: Generator with the list of token records of each stanza of every
+        text, a single one if the text is not split
+    :rtype: generator
+    """
+    if nlp is None:
+        nlp = load_pipeline()
+    chunks = pipe_chunks(nlp, texts, split_stanzas_on, chunk_size, **kwargs)
+    current = stanzas = None
+    for index, doc in chunks:
+        if index != current:
+            if stanzas is not None:
+                yield join_chunk_stanzas(stanzas, split_stanzas_on)
+            current = index
+            stanzas = []
+        stanzas.extend(tag_stanzas([doc], split_stanzas_on, nlp))
+        del doc
+    if stanzas is not None:
+        yield join_chunk_stanzas(stanzas, split_stanzas_on)
+
+
+# A spaCy pipeline is not safe to use from several threads at once, so the
+# threads sharing the pipeline of a process take turns to tag
+_tagging_lock = Lock()
+
+
+def tag_texts_locked(texts, split_stanzas_on=None, chunk_size=None,
+                     nlp=None, **kwargs):
+    """Tags several texts as `tag_texts` does, holding a lock shared by every
+    thread of the process while tagging, so only the scansion of the tagged
+    texts runs in several threads at once
+
+    :param texts: Iterable of full texts to be analyzed
+    :param split_stanzas_on: String or regular expression to split the texts
+        in stanzas. Defaults to None for not splitting
+    :param chunk_size: Maximum number of characters of text tagged at once.
+        Defaults to None for the maximum length of the pipeline
+    :param nlp: spaCy pipeline. Defaults to None for `load_pipeline`
+    :param kwargs: Keyword arguments for `nlp.pipe`
+    :return: List with the list of token records of each stanza of every
+        text, a single one if the text is not split
+    :rtype: list
+    """
+    with _tagging_lock:
+        return list(tag_texts(texts, split_stanzas_on, chunk_size, nlp,
+                              **kwargs))
+
+
+def tag_lines(text, chunk_size=None):
+    """Tags a text and groups its tokens in lines of verse. Tokens are
+    replaced by their records, so the Doc can be freed as soon as the text
+    (or every chunk of it) is tagged
+
+    :param text: Full text to be analyzed, or its tokens already tagged as a
+        spaCy `Doc` or a list of token records
+    :param chunk_size: Maximum number of characters of text tagged at once.
+        Longer texts are tagged in chunks of whole lines. Defaults to None
+        for the maximum length of the pipeline
+    :return: Generator with the list of token records of each line
+    :rtype: generator
+    """
+    if isinstance(text, (Doc, Span, list, tuple)):
+        lines = deque(get_token_records(line_tokens)
+                      for line_tokens in get_token_lines(text))
+        # No reference to the tokens is kept while the lines are scanned
+        del text
+        while lines:
+            yield lines.popleft()
+        return
+    nlp = load_pipeline()
+    if chunk_size is None and isinstance(text, str):
+        chunk_size = nlp.max_length
+    if chunk_size is None or len(text) <= chunk_size:
+        # Tagged lazily so no reference to the Doc is kept
+        docs = map(nlp, [text])
+    else:
+        docs = nlp.pipe(iter_text_chunks(text, chunk_size), batch_size=1)
+    for doc in docs:
+        lines = deque(get_token_records(line_tokens)
+                      for line_tokens in get_token_lines(doc))
+        del doc
+        # Popped so every line is freed once the caller is done with it
+        while lines:
+            yield lines.popleft()
+
+
+def _get_scansion(text, rhyme_analysis=False, rhythm_format="pattern",
+                  rhythmical_lengths=None, split_stanzas_on=None,
+                  pos_output=False, always_return_rhyme=False,
+                  max_liaison_candidates=MAX_LIAISON_CANDIDATES,
+                  chunk_size=None):
+    """Generates a list of dictionaries for each line
+
+    :param text: Full text to be analyzed, or its tokens already tagged as a
+        spaCy `Doc` or a list of token records
+    :param rhyme_analysis: Specify if rhyme analysis is to be performed
+    :param rhythm_format: output format for rhythm analysis
+    :param rhythmical_lengths: List with explicit rhythmical lengths per line
+        that the analysed lines has to meet
+    :param split_stanzas_on: String or regular expression to split text in
+        stanzas. Defaults to None for not splitting.
+    :param pos_output: `True` or `False` for printing the PoS of the words
+    :param always_return_rhyme: `True` or `False` for printing rhyme pattern
+        even if no structure is detected
+    :param max_liaison_candidates: Maximum number of liaison combinations to
+        explore per line to meet its rhythmical length. None for no limit
+    :param chunk_size: Maximum number of characters of text tagged at once.
+        Longer texts are tagged in chunks of whole lines. Defaults to None
+        for the maximum length of the pipeline
+    :return: list of dictionaries per line
+    :rtype: list
+    """
+    raw_tokens = list(tag_lines(text, chunk_size))
+    # Extract words, phonological groups and rhythm per line
+    lines = [
+        get_line_scansion(line_tokens, rhythm_format, rhyme_analysis,
+                          pos_output)
+        for line_tokens in raw_tokens
+    ]
     if rhyme_analysis:
         analyzed_lines = analyze_rhyme(lines,
                                        always_return_rhyme=always_return_rhyme)
@@ -770,22 +1370,96 @@ def _get_scansion(text, rhyme_analysis=False, rhythm_format="pattern",
                 repetitions = int(len(lines) / len(structure_length))
                 structure_length = structure_length * repetitions
         if structure_length:
-            if line["rhythm"]["length"] < structure_length[idx]:
-                candidates = generate_phonological_groups(raw_tokens[idx],
-                                                          pos_output)
-                for candidate in candidates:
-                    rhythm = get_rhythmical_pattern(
-                        candidate, rhythm_format,
-                        rhyme_analysis=rhyme_analysis)
-                    if rhythm["length"] == structure_length[idx]:
-                        line.update({
-                            "phonological_groups": candidate,
-                            "rhythm": rhythm,
-                        })
-                        break
+            adjust_line_length(line, raw_tokens[idx], structure_length[idx],
+                               rhythm_format, rhyme_analysis, pos_output,
+                               max_liaison_candidates)
     return remove_exact_length_matches(lines)
 
 
+def scan_token_records(stanzas, **options):
+    """Generates the scansion of a text already tagged and split in stanzas,
+    e.g. in a process other than the one that tagged it
+
+    :param stanzas: List with the list of token records of each stanza, a
+        single one if the text is not split
+    :param options: Keyword arguments for `get_scansion`, with the
+        split_stanzas_on the text was split on
+    :return: The scansion of the text, as returned by `get_scansion`
+    :rtype: list
+    """
+    if options.get("split_stanzas_on") is None:
+        return _get_scansion(stanzas[0], **options)
+    return [_get_scansion(stanza, **options) for stanza in stanzas]
+
+
+# Default maximum number of characters tagged at once when scanning line by
+# line, which bounds the memory taken by the tokens of the pending lines
+ITER_CHUNK_SIZE = 10000
+
+
+def iter_scansion(text, rhythm_format="pattern", rhythmical_lengths=None,
+                  pos_output=False,
+                  max_liaison_candidates=MAX_LIAISON_CANDIDATES,
+                  chunk_size=ITER_CHUNK_SIZE):
+    """Generates the scansion of a text line by line, yielding every line as
+    soon as it is scanned. Rhyme analysis and the lengths of the detected
+    metrical structures need all the lines, so they are not available
+
+    :param text: Full text to be analyzed, or its tokens already tagged as a
+        spaCy `Doc` or a list of token records
+    :param rhythm_format: output format for rhythm analysis
+    :param rhythmical_lengths: List with explicit rhythmical lengths per line
+        that the analysed lines has to meet
+    :param pos_output: `True` or `False` for printing the PoS of the words
+    :param max_liaison_candidates: Maximum number of liaison combinations to
+        explore per line to meet its rhythmical length. None for no limit
+    :param chunk_size: Maximum number of characters of text tagged at once,
+        which bounds the memory taken by the tokens of the lines waiting to
+        be scanned. Smaller chunks yield the first lines sooner. None for the
+        maximum length of the pipeline
+    :return: Generator with a dictionary per line, as in the list returned
+        by `get_scansion`
+    :rtype: generator
+    """
+    for index, line_tokens in enumerate(tag_lines(text, chunk_size)):
+        line = get_line_scansion(line_tokens, rhythm_format, False,
+                                 pos_output)
+        if rhythmical_lengths:
+            adjust_line_length(line, line_tokens, rhythmical_lengths[index],
+                               rhythm_format, False, pos_output,
+                               max_liaison_candidates)
+        yield remove_exact_length_matches([line])[0]
+
+
+def adjust_line_length(line, tokens, length, rhythm_format="pattern",
+                       rhyme_analysis=False, pos_output=False,
+                       max_liaison_candidates=MAX_LIAISON_CANDIDATES):
+    """Makes a line shorter than its expected rhythmical length meet it, if
+    possible, by looking for other liaisons among its phonological groups
+
+    :param line: Dictionary of the scansion of the line, which is updated
+    :param tokens: Tokens of the line
+    :param length: Expected rhythmical length of the line
+    :param rhythm_format: output format for rhythm analysis
+    :param rhyme_analysis: Specify if rhyme analysis is performed
+    :param pos_output: `True` or `False` for printing the PoS of the words
+    :param max_liaison_candidates: Maximum number of liaison combinations to
+        explore. None for no limit
+    :return: The line
+    :rtype: dict
+    """
+    if line["rhythm"]["length"] < length:
+        candidate = find_phonological_groups(
+            tokens, length, pos_output, max_candidates=max_liaison_candidates)
+        if candidate is not None:
+            line.update({
+                "phonological_groups": candidate,
+                "rhythm": get_rhythmical_pattern(
+                    candidate, rhythm_format, rhyme_analysis=rhyme_analysis),
+            })
+    return line
+
+
 def break_on_h(liaison_type, syllable_left, syllable_right):
     return (
             liaison_type == "synalepha"
@@ -793,74 +1467,334 @@ def break_on_h(liaison_type, syllable_left, syllable_right):
     )
 
 
-def generate_phonological_groups(tokens, pos_output=False):
+def break_on_h_compact(liaison_type, group_left, group_right):
+    """Same as `break_on_h` but for compact phonological groups"""
+    return liaison_type == "synalepha" and group_right[2]
+
+
+def get_compact_groups(syllables):
+    """Gets a compact representation of a list of syllables or phonological
+    groups, with a tuple per group made of whether it is stressed, whether it
+    is the end of a word, and whether it starts with 'h'. It keeps just what
+    is needed to compute the rhythmical length of a line.
+
+    :param syllables: List of dictionaries of syllables
+    :return: List of tuples of boolean values
+    :rtype: list
+    """
+    return [
+        (syllable["is_stressed"],
+         syllable.get("is_word_end", False),
+         syllable["syllable"][0].lower() == "h")
+        for syllable in syllables
+    ]
+
+
+def join_compact_groups(groups, liaison_type="synalepha", breakage_func=None,
+                        liaison_positions=None):
+    """Joins compact phonological groups according to a type of liaison
+    exactly as `get_phonological_groups` does with dictionaries, but without
+    building the syllables and their liaison indices
+
+    :param groups: List of compact phonological groups
+    :param liaison_type: Which liaison is going to be performed synalepha or
+        sinaeresis
+    :param breakage_func: Function to decide when not to break a liaison that is
+        specified in liaison_positions
+    :param liaison_positions: Positions of the liaisons
+    :return: A list of conjoined compact groups
+    :rtype: list
+    """
+    skip_next = False
+    while sum(liaison_positions) > 0:
+        liaison_index = []
+        reduced_groups = []
+        for idx, group in enumerate(groups):
+            if skip_next:
+                skip_next = False
+                continue
+            breakage = False
+            if idx < len(groups) - 1:
+                next_group = groups[idx + 1]
+                breakage = (
+                        breakage_func is not None
+                        and breakage_func(liaison_type, group, next_group)
+                )
+            if liaison_positions[idx] and not breakage:
+                reduced_groups.append(
+                    (group[0] or next_group[0], next_group[1], group[2]))
+                liaison_index.append(liaison_positions[idx + 1])
+                skip_next = True
+            else:
+                reduced_groups.append(group)
+                liaison_index.append(0)
+        liaison_positions = liaison_index
+        groups = reduced_groups
+    return groups
+
+
+def generate_liaisons(syllables, groups, join_func, breakage_func,
+                      target_length=None):
+    """Generates the combinations of liaisons for the syllables of a line, in
+    order of priority, and the phonological groups they produce
+
+    :param syllables: List of dictionaries of syllables of the line
+    :param groups: The same syllables, in the representation of join_func
+    :param join_func: Function to join groups given a liaison type, a
+        breakage function and the liaison positions
+    :param breakage_func: Function to decide when not to break a synalepha
+        starting with 'h', for groups in the representation of join_func
+    :param target_length: Rhythmical length the phonological groups should
+        have. If given, combinations of liaisons that can not produce that
+        length are not generated. Defaults to None for generating them all
+    :return: Generator of tuples with the types of liaison, the breakage
+        function (or None), a tuple with the liaison positions for each type,
+        and the joined groups
+    :rtype: generator
+    """
+    # The rhythmical length differs at most in 1 from the number of groups
+    if target_length is None:
+        min_groups = max_groups = None
+    else:
+        min_groups, max_groups = target_length - 1, target_length + 1
+    for liaison in (
+            ("synalepha",),
+            ("synalepha", "sinaeresis"),
+            ("sinaeresis",),
+            ("sinaeresis", "synalepha"),
+    ):
+        for ignore_synalepha_h in (breakage_func, None):
+            for liaison_positions_1 in generate_liaison_positions(
+                    syllables, liaison[0],
+                    groups=groups,
+                    breakage_func=ignore_synalepha_h,
+                    min_groups=min_groups,
+                    # A second liaison can only reduce the groups further
+                    max_groups=max_groups if len(liaison) == 1 else None,
+            ):
+                groups_1 = join_func(
+                    groups,
+                    liaison_type=liaison[0],
+                    liaison_positions=liaison_positions_1,
+                    breakage_func=ignore_synalepha_h,
+                )
+                if len(liaison) == 1:
+                    yield (liaison, ignore_synalepha_h,
+                           (liaison_positions_1, ), groups_1)
+                    continue
+                for liaison_positions_2 in generate_liaison_positions(
+                        syllables, liaison[1],
+                        groups=groups_1,
+                        breakage_func=ignore_synalepha_h,
+                        min_groups=min_groups,
+                        max_groups=max_groups,
+                ):
+                    yield (liaison, ignore_synalepha_h,
+                           (liaison_positions_1, liaison_positions_2),
+                           join_func(
+                               groups_1,
+                               liaison_type=liaison[1],
+                               liaison_positions=liaison_positions_2,
+                               breakage_func=ignore_synalepha_h,
+                           ))
+
+
+def generate_phonological_groups(tokens, pos_output=False,
+                                 target_length=None):
     """Generates phonological groups from a list of tokens
 
     :param tokens: list of spaCy tokens
     :param pos_output: `True` or `False` for printing the PoS of the words
+    :param target_length: Rhythmical length the phonological groups should
+        have. If given, combinations of liaisons that can not produce that
+        length are not generated. Defaults to None for generating them all
     :return: Generator with a list of phonological groups
     :rtype: generator
     """
     for alternative_syllabification in (True, False):
         words = get_words(tokens, alternative_syllabification, pos_output)
         syllables = get_syllables_word_end(words)
-        for liaison in (
-                ("synalepha",),
-                ("synalepha", "sinaeresis"),
-                ("sinaeresis",),
-                ("sinaeresis", "synalepha"),
-        ):
-            for ignore_synalepha_h in (break_on_h, None):
-                for liaison_positions_1 in generate_liaison_positions(
-                        syllables, liaison[0]
-                ):
-                    groups = get_phonological_groups(
-                        syllables[:],
-                        liaison_type=liaison[0],
-                        liaison_positions=liaison_positions_1,
-                        breakage_func=ignore_synalepha_h,
+        for *_, groups in generate_liaisons(
+                syllables, syllables, get_phonological_groups, break_on_h,
+                target_length):
+            yield groups
+
+
+def find_phonological_groups(tokens, target_length, pos_output=False,
+                             max_candidates=None):
+    """Finds the first phonological groups from a list of tokens, in the order
+    of `generate_phonological_groups`, that have a rhythmical length. The
+    candidates are built as compact phonological groups and only the one
+    found is built as a list of dictionaries
+
+    :param tokens: list of spaCy tokens
+    :param target_length: Rhythmical length the phonological groups must have
+    :param pos_output: `True` or `False` for printing the PoS of the words
+    :param max_candidates: Maximum number of candidates to explore. Defaults
+        to None for no limit
+    :return: List of phonological groups, or None if not found
+    :rtype: list
+    """
+    if max_candidates is not None and max_candidates < 1:
+        return None
+    explored = 0
+    for alternative_syllabification in (True, False):
+        words = get_words(tokens, alternative_syllabification, pos_output)
+        syllables = get_syllables_word_end(words)
+        for liaison, breakage_func, liaison_positions, groups in (
+                generate_liaisons(
+                    syllables, get_compact_groups(syllables),
+                    join_compact_groups, break_on_h_compact, target_length)):
+            explored += 1
+            stresses = adjust_stresses([group[0] for group in groups],
+                                       [group[1] for group in groups])
+            if len(stresses) == target_length:
+                phonological_groups = syllables
+                for liaison_type, positions in zip(liaison, liaison_positions):
+                    phonological_groups = get_phonological_groups(
+                        phonological_groups,
+                        liaison_type=liaison_type,
+                        liaison_positions=positions,
+                        breakage_func=(
+                            None if breakage_func is None else break_on_h),
                     )
-                    if len(liaison) == 1:
-                        yield groups
-                    else:
-                        for liaison_positions_2 in generate_liaison_positions(
-                                syllables, liaison[1]
-                        ):
-                            yield get_phonological_groups(
-                                groups,
-                                liaison_type=liaison[1],
-                                liaison_positions=liaison_positions_2,
-                                breakage_func=ignore_synalepha_h,
-                            )
-
-
-def generate_liaison_positions(syllables, liaison):
+                return phonological_groups
+            if max_candidates is not None and explored >= max_candidates:
+                return None
+    return None
+
+
+def generate_liaison_positions(syllables, liaison, groups=None,
+                               breakage_func=None, min_groups=None,
+                               max_groups=None):
     """Generates all possible combinations for the liaisons on a list of syllables
 
     :param syllables: List of syllables with
     :param liaison: Type of liaison combination to be generated
+    :param groups: List of phonological groups the liaisons will be applied
+        to. Defaults to the syllables
+    :param breakage_func: Function to decide when not to break a liaison, as
+        used in `get_phonological_groups`
+    :param min_groups: Minimum number of phonological groups that applying
+        the liaisons must be able to produce. Defaults to None for no minimum
+    :param max_groups: Maximum number of phonological groups that applying
+        the liaisons must be able to produce. Defaults to None for no maximum
     :return: Generator with a list of possible combinations
     :rtype: generator
     """
+    if groups is None:
+        groups = syllables
     positions = [int(syllable.get(f"has_{liaison}", 0))
                  for syllable in syllables]
-    # Combinations start by applying all possible liaisons: [1, 1, ...]
-    combinations = list(product([1, 0], repeat=sum(positions)))
     liaison_indices = [
         index for index, position in enumerate(positions) if position
     ]
-    # Prioritize single liaisons
-    non_single_liaisons = []
-    for combination in combinations:
-        liaison_positions = [0] * len(positions)
-        for index, liaison_index in enumerate(liaison_indices):
-            liaison_positions[liaison_index] = combination[index]
-        if has_single_liaisons(liaison_positions):
-            yield liaison_positions
+    # Liaisons joining two groups always remove one of them, unless broken,
+    # while a liaison on the last group may remove one group or none
+    removals = []
+    optional_removals = []
+    for liaison_index in liaison_indices:
+        if liaison_index < len(groups) - 1:
+            removals.append(int(
+                breakage_func is None
+                or not breakage_func(liaison, groups[liaison_index],
+                                     groups[liaison_index + 1])
+            ))
+            optional_removals.append(0)
         else:
-            non_single_liaisons.append(liaison_positions)
-    for liaison_position in non_single_liaisons:
-        yield liaison_position
+            removals.append(0)
+            optional_removals.append(int(liaison_index == len(groups) - 1))
+    max_removals = (
+        None if min_groups is None else len(groups) - min_groups)
+    min_removals = (
+        None if max_groups is None else len(groups) - max_groups)
+    # Whether each liaison is right after the previous one
+    consecutive = [
+        index > 0 and liaison_indices[index - 1] + 1 == liaison_index
+        for index, liaison_index in enumerate(liaison_indices)
+    ]
+    # Combinations start by applying all possible liaisons: [1, 1, ...]
+    # Prioritize single liaisons, streaming them before the rest
+    for single_liaisons in (True, False):
+        for combination in generate_liaison_combinations(
+                removals, optional_removals, max_removals, min_removals,
+                consecutive=consecutive, single_liaisons=single_liaisons):
+            liaison_positions = [0] * len(positions)
+            for index, liaison_index in enumerate(liaison_indices):
+                liaison_positions[liaison_index] = combination[index]
+            yield liaison_positions
+
+
+def generate_liaison_combinations(removals, optional_removals,
+                                  max_removals=None, min_removals=None,
+                                  consecutive=None, single_liaisons=None):
+    """Generates the combinations of applying (1) or not (0) each liaison, in
+    the same order as `itertools.product([1, 0], repeat=n)`, but pruning the
+    combinations that can not remove a number of groups between min_removals
+    and max_removals. Branches are discarded as soon as they become unfeasible
+    and combinations are generated one at a time, without materializing them
+
+    :param removals: List with the number of groups each liaison removes
+    :param optional_removals: List with the number of groups each liaison may
+        remove or not
+    :param max_removals: Maximum number of groups to remove. Defaults to None
+        for no maximum
+    :param min_removals: Minimum number of groups to remove. Defaults to None
+        for no minimum
+    :param consecutive: List with `True` for the liaisons that are right
+        after the previous one, and `False` otherwise
+    :param single_liaisons: `True` to generate only combinations without
+        consecutive liaisons applied, `False` to generate only combinations
+        with consecutive liaisons applied, or None for generating both
+    :return: Generator with tuples of 1's and 0's
+    :rtype: generator
+    """
+    size = len(removals)
+    if consecutive is None:
+        consecutive = [False] * size
+    # Removals and consecutive liaisons still available from each liaison on
+    pending_removals = [0] * (size + 1)
+    pending_optional_removals = [0] * (size + 1)
+    pending_consecutive = [0] * (size + 1)
+    for index in range(size - 1, -1, -1):
+        pending_removals[index] = (
+            pending_removals[index + 1] + removals[index])
+        pending_optional_removals[index] = (
+            pending_optional_removals[index + 1] + optional_removals[index])
+        pending_consecutive[index] = (
+            pending_consecutive[index + 1] + consecutive[index])
+    combination = [0] * size
+
+    def expand(index, removed, optionally_removed, has_consecutive):
+        if max_removals is not None and removed > max_removals:
+            return
+        if min_removals is not None:
+            reachable = removed + pending_removals[index]
+            if max_removals is not None:
+                reachable = min(reachable, max_removals)
+            reachable += (optionally_removed
+                          + pending_optional_removals[index])
+            if reachable < min_removals:
+                return
+        if single_liaisons is True and has_consecutive:
+            return
+        if (single_liaisons is False and not has_consecutive
+                and not pending_consecutive[index]):
+            return
+        if index == size:
+            yield tuple(combination)
+            return
+        for value in (1, 0):
+            combination[index] = value
+            yield from expand(
+                index + 1,
+                removed + value * removals[index],
+                optionally_removed + value * optional_removals[index],
+                has_consecutive or bool(
+                    value and consecutive[index] and combination[index - 1]),
+            )
+
+    yield from expand(0, 0, 0, False)
 
 
 def has_single_liaisons(liaisons):
@@ -0,0 +1,154 @@
+"""
+Scansion daemon listening on a local Unix socket.
+
+The daemon loads the spaCy pipeline once and keeps it warm, so clients only
+pay the cost of the scansion itself. The protocol is line based: clients send
+a JSON object per line with the text to scan and the options for
+`get_scansion`, and the daemon answers every request with a JSON object in a
+single line, holding either the scansion or an error message.
+
+Every client is answered on its own thread, but texts are tagged one at a
+time since a spaCy pipeline is not safe to use from several threads at once.
+Only their token records are scanned concurrently.
+"""
+import json
+import os
+import socket
+import socketserver
+import stat
+import tempfile
+
+from .core import scan_token_records
+from .core import tag_texts_locked
+from .pipeline import load_pipeline
+
+
+def get_default_socket_path():
+    """Gets the default path of the Unix socket for the current user, in
+    their runtime directory if there is one or in the temporary directory
+    otherwise
+
+    :return: Path of the Unix socket
+    :rtype: str
+    """
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return os.path.join(runtime_dir, "rantanplan.sock")
+    return os.path.join(tempfile.gettempdir(),
+                        f"rantanplan-{os.getuid()}.sock")
+
+
+SOCKET_PATH = get_default_socket_path()
+
+
+def tag_text(text, split_stanzas_on=None):
+    """Tags a text in chunks of at most the maximum length of the pipeline,
+    while no other thread tags
+
+    :param text: Full text to be analyzed
+    :param split_stanzas_on: Regular expression to split the text in
+        stanzas. Defaults to None for not splitting
+    :return: List with the list of token records of each stanza, a single
+        one if the text is not split
+    :rtype: list
+    """
+    return tag_texts_locked([text], split_stanzas_on, nlp=load_pipeline(),
+                            batch_size=1)[0]
+
+
+class ScansionRequestHandler(socketserver.StreamRequestHandler):
+    """Answers the scansion requests of a client connection, one per line"""
+
+    def handle(self):
+        for request in self.rfile:
+            try:
+                request = json.loads(request)
+                options = request.get("options", {})
+                stanzas = tag_text(request["text"],
+                                   options.get("split_stanzas_on"))
+                response = {"scansion": scan_token_records(stanzas, **options)}
+            except Exception as error:
+                response = {"error": f"{type(error).__name__}: {error}"}
+            self.wfile.write(
+                json.dumps(response, ensure_ascii=False).encode("utf-8"))
+            self.wfile.write(b"\n")
+
+
+def make_server(socket_path=SOCKET_PATH):
+    """Creates a threaded server for scansion requests bound to a Unix socket
+    only accessible by the current user. A stale socket, which no server is
+    listening on anymore, is replaced
+
+    :param socket_path: Path of the Unix socket
+    :return: Server ready to serve requests
+    :rtype: socketserver.ThreadingUnixStreamServer
+    :raises FileExistsError: If the path exists and is not a socket, or a
+        server is still listening on it
+    """
+    if os.path.lexists(socket_path):
+        if not stat.S_ISSOCK(os.lstat(socket_path).st_mode):
+            raise FileExistsError(f"{socket_path} exists and is not a socket")
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            try:
+                client.connect(socket_path)
+            except ConnectionRefusedError:
+                os.unlink(socket_path)
+            else:
+                raise FileExistsError(
+                    f"A server is already listening on {socket_path}")
+    server = socketserver.ThreadingUnixStreamServer(socket_path,
+                                                    ScansionRequestHandler)
+    server.daemon_threads = True
+    os.chmod(socket_path, 0o600)
+    return server
+
+
+def serve(socket_path=SOCKET_PATH):
+    """Loads the pipeline and serves scansion requests on a Unix socket until
+    interrupted
+
+    :param socket_path: Path of the Unix socket
+    """
+    load_pipeline()
+    server = make_server(socket_path)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.unlink(socket_path)
+
+
+def get_scansion_remote(texts, socket_path=SOCKET_PATH, **options):
+    """Generates the scansion of several texts sending them to a daemon
+    started with `serve`
+
+    :param texts: Iterable of full texts to be analyzed
+    :param socket_path: Path of the Unix socket of the daemon
+    :param options: Keyword arguments for `get_scansion`
+    :return: Generator with the scansion of each text in input order, as
+        returned by `get_scansion`
+    :rtype: generator
+    :raises ConnectionError: If no daemon is listening on the socket, or the
+        daemon closes the connection
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        try:
+            client.connect(socket_path)
+        except (FileNotFoundError, ConnectionRefusedError) as error:
+            raise ConnectionError(
+                f"No daemon is listening on {socket_path}") from error
+        with client.makefile("rwb") as stream:
+            for text in texts:
+                stream.write(json.dumps({
+                    "text": text,
+                    "options": options,
+                }, ensure_ascii=False).encode("utf-8"))
+                stream.write(b"\n")
+                stream.flush()
+                response = stream.readline()
+                if not response:
+                    raise ConnectionError("The daemon closed the connection")
+                response = json.loads(response)
+                if "error" in response:
+                    raise RuntimeError(response["error"])
+                yield response["scansion"]
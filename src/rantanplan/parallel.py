@@ -0,0 +1,471 @@
+"""
+Multiprocess scansion of large corpora.
+
+Each worker of the pool loads the spaCy pipeline once when it starts, and
+poems are sent to the workers in shards of similar size so the load is
+balanced among them. Results are yielded in input order while keeping only
+a bounded number of shards in flight.
+
+With preloading, the pipeline is instead loaded and warmed up in the parent
+process before forking the workers, so they all share its memory pages
+copy-on-write.
+
+The staged engine splits the work in two instead: tagging processes run
+spaCy and send compact token records through bounded queues to scansion
+processes, which run the pure Python syllabification, liaison and rhyme
+analysis. The number of processes of each stage is set independently.
+
+Long poems can also be split in stanzas that are tagged at once and then
+scanned in parallel.
+"""
+import gc
+import os
+import queue
+import threading
+import traceback
+from collections import deque
+from functools import partial
+from multiprocessing import Pool
+from multiprocessing import get_context
+
+from .core import MAX_LIAISON_CANDIDATES
+from .core import _get_scansion
+from .core import get_scansion
+from .core import get_scansion_batch
+from .core import get_stanzas
+from .core import scan_token_records
+from .core import tag_texts
+from .pipeline import load_pipeline
+from .records import get_token_records
+
+# Approximate number of characters of poetry per shard sent to a worker
+SHARD_SIZE = 10000
+# Text scanned in the parent process to warm up the pipeline and caches
+WARM_UP_TEXT = "Me gustas cuando callas porque estás como ausente,"
+# Maximum number of texts waiting in each queue of the staged engine
+QUEUE_SIZE = 64
+# Seconds between checks for stopped processes of the staged engine
+POLL_INTERVAL = 0.1
+
+
+def _init_worker():
+    """Warm up the pipeline of a worker so it is only loaded once"""
+    load_pipeline()
+
+
+def _scan_shard(texts, options, report_memory=False):
+    """Generates the scansion of a shard of texts inside a worker
+
+    :param texts: List of texts to be analyzed
+    :param options: Dictionary with the options for `get_scansion_batch`
+    :param report_memory: Whether to return the memory of the worker too
+    :return: List with the scansion of each text, and the memory of the
+        worker as returned by `get_memory_info` if report_memory is `True`
+    :rtype: list
+    """
+    scansions = list(get_scansion_batch(texts, **options))
+    if report_memory:
+        return scansions, get_memory_info()
+    return scansions
+
+
+def get_memory_info():
+    """Gets the memory of the current process. The unique set size (USS) is
+    the memory only the process uses, while the resident set size (RSS) also
+    counts the pages it shares with others, such as the pipeline inherited
+    from the parent process. Sizes are only available on Linux
+
+    :return: Dictionary with the process id and its RSS, proportional set
+        size (PSS) and USS in bytes (None if not available)
+    :rtype: dict
+    """
+    info = {"pid": os.getpid(), "rss": None, "pss": None, "uss": None}
+    sizes = {}
+    try:
+        with open("/proc/self/smaps_rollup") as smaps:
+            for line in smaps:
+                name, _, value = line.partition(":")
+                value = value.split()
+                if len(value) == 2 and value[1] == "kB":
+                    sizes[name] = int(value[0]) * 1024
+    except OSError:
+        return info
+    info.update({
+        "rss": sizes.get("Rss"),
+        "pss": sizes.get("Pss"),
+        "uss": (sizes.get("Private_Clean", 0)
+                + sizes.get("Private_Dirty", 0)),
+    })
+    return info
+
+
+def preload_pipeline():
+    """Loads the pipeline in the current process and warms it up, so
+    processes forked afterwards inherit it ready to use. The objects created
+    so far stay frozen until `gc.unfreeze` is called once they are forked"""
+    get_scansion(WARM_UP_TEXT)
+    gc.collect()
+    # Keep the garbage collector from touching, and so copying, the memory
+    # pages of the objects created so far in the forked processes
+    gc.freeze()
+
+
+def shard_texts(texts, shard_size=SHARD_SIZE):
+    """Groups consecutive texts in shards of approximately the same size in
+    characters, so every shard involves a similar amount of work
+
+    :param texts: Iterable of texts
+    :param shard_size: Minimum number of characters per shard (the last one
+        can be smaller)
+    :return: Generator with lists of texts
+    :rtype: generator
+    """
+    shard = []
+    size = 0
+    for text in texts:
+        shard.append(text)
+        size += len(text)
+        if size >= shard_size:
+            yield shard
+            shard = []
+            size = 0
+    if shard:
+        yield shard
+
+
+def scan_corpus(texts, rhyme_analysis=False, rhythm_format="pattern",
+                rhythmical_lengths=None, split_stanzas_on=None,
+                pos_output=False, always_return_rhyme=False, workers=None,
+                shard_size=SHARD_SIZE, max_pending_shards=None,
+                batch_size=1000, preload=False, memory_report=None,
+                max_liaison_candidates=MAX_LIAISON_CANDIDATES,
+                chunk_size=None):
+    """Generates the scansion of a corpus of texts using a pool of processes
+
+    :param texts: Iterable of full texts to be analyzed
+    :param rhyme_analysis: Specify if rhyme analysis is to be performed
+    :param rhythm_format: output format for rhythm analysis
+    :param rhythmical_lengths: List with explicit rhythmical lengths per line
+        that the analysed lines has to meet
+    :param split_stanzas_on: Regular expression to split texts in stanzas.
+        Defaults to None for not splitting.
+    :param pos_output: `True` or `False` for printing the PoS of the words
+    :param always_return_rhyme: `True` or `False` for printing rhyme pattern
+        even if no structure is detected
+    :param workers: Number of worker processes. Defaults to the number of CPUs
+    :param shard_size: Approximate number of characters sent to a worker at
+        once
+    :param max_pending_shards: Maximum number of shards being processed or
+        waiting to be yielded at any time. Defaults to twice the workers
+    :param batch_size: Number of texts to buffer for each spaCy batch inside
+        a worker
+    :param preload: Whether to load and warm up the pipeline in this process
+        and fork the workers afterwards, so they share it instead of loading
+        their own copy. Only available where processes can be forked
+    :param memory_report: Dictionary to update with the latest memory of each
+        worker, keyed by process id, as returned by `get_memory_info`
+    :param max_liaison_candidates: Maximum number of liaison combinations to
+        explore per line to meet its rhythmical length. None for no limit
+    :param chunk_size: Maximum number of characters of text tagged at once.
+        Longer texts are tagged in chunks of whole lines, or of whole stanzas
+        if split. Defaults to None for the maximum length of the pipeline
+    :return: Generator with the scansion of each text in input order, as
+        returned by `get_scansion`
+    :rtype: generator
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if max_pending_shards is None:
+        max_pending_shards = 2 * workers
+    options = dict(
+        rhyme_analysis=rhyme_analysis,
+        rhythm_format=rhythm_format,
+        rhythmical_lengths=rhythmical_lengths,
+        split_stanzas_on=split_stanzas_on,
+        pos_output=pos_output,
+        always_return_rhyme=always_return_rhyme,
+        batch_size=batch_size,
+        max_liaison_candidates=max_liaison_candidates,
+        chunk_size=chunk_size,
+    )
+    report_memory = memory_report is not None
+
+    def get_scansions(result):
+        if not report_memory:
+            return result.get()
+        scansions, memory = result.get()
+        memory_report[memory["pid"]] = memory
+        return scansions
+
+    if preload:
+        preload_pipeline()
+        try:
+            pool = get_context("fork").Pool(workers, initializer=_init_worker)
+        finally:
+            # Once the workers are forked, this process can collect the
+            # frozen objects again
+            gc.unfreeze()
+    else:
+        pool = Pool(workers, initializer=_init_worker)
+    with pool:
+        pending = deque()
+        for shard in shard_texts(texts, shard_size):
+            pending.append(pool.apply_async(
+                _scan_shard, (shard, options, report_memory)))
+            if len(pending) >= max_pending_shards:
+                yield from get_scansions(pending.popleft())
+        while pending:
+            yield from get_scansions(pending.popleft())
+
+
+def scan_poem(text, split_stanzas_on="\n\n", rhyme_analysis=False,
+              rhythm_format="pattern", rhythmical_lengths=None,
+              pos_output=False, always_return_rhyme=False, workers=None,
+              executor=None, stanzas_per_task=None,
+              max_liaison_candidates=MAX_LIAISON_CANDIDATES, chunk_size=None):
+    """Generates the scansion of a long poem, tagging it once in this
+    process and scanning its stanzas in parallel
+
+    :param text: Full text to be analyzed, or its tokens already tagged as a
+        spaCy `Doc` or a list of token records
+    :param split_stanzas_on: Regular expression to split the text in stanzas
+    :param rhyme_analysis: Specify if rhyme analysis is to be performed
+    :param rhythm_format: output format for rhythm analysis
+    :param rhythmical_lengths: List with explicit rhythmical lengths per line
+        that the analysed lines has to meet
+    :param pos_output: `True` or `False` for printing the PoS of the words
+    :param always_return_rhyme: `True` or `False` for printing rhyme pattern
+        even if no structure is detected
+    :param workers: Number of worker processes. Defaults to the number of CPUs
+    :param executor: Pool of processes or executor to scan the stanzas on
+        instead of a new pool of processes, e.g. to scan several poems
+    :param stanzas_per_task: Number of stanzas sent to a worker at once.
+        Defaults to a fourth of the stanzas per worker
+    :param max_liaison_candidates: Maximum number of liaison combinations to
+        explore per line to meet its rhythmical length. None for no limit
+    :param chunk_size: Maximum number of characters of text tagged at once.
+        Longer texts are tagged in chunks of whole stanzas. Defaults to None
+        for the maximum length of the pipeline
+    :return: list of list of dictionaries per line, one list per stanza in
+        the order of the text
+    :rtype: list
+    """
+    # Records are sent to the workers instead of spans, which need their Doc
+    if isinstance(text, str):
+        stanzas = next(tag_texts([text], split_stanzas_on, chunk_size,
+                                 batch_size=1))
+    else:
+        stanzas = [get_token_records(stanza)
+                   for stanza in get_stanzas(text, split_stanzas_on)]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if stanzas_per_task is None:
+        stanzas_per_task = max(1, len(stanzas) // (4 * workers))
+    scan_stanza = partial(
+        _get_scansion,
+        rhyme_analysis=rhyme_analysis,
+        rhythm_format=rhythm_format,
+        rhythmical_lengths=rhythmical_lengths,
+        pos_output=pos_output,
+        always_return_rhyme=always_return_rhyme,
+        max_liaison_candidates=max_liaison_candidates,
+    )
+    if executor is not None:
+        return list(executor.map(scan_stanza, stanzas,
+                                 chunksize=stanzas_per_task))
+    with Pool(workers) as pool:
+        return pool.map(scan_stanza, stanzas, chunksize=stanzas_per_task)
+
+
+def _tag_stage(texts, records, results, split_stanzas_on, batch_size,
+               chunk_size=None):
+    """Tags texts and sends their token records to the scansion stage,
+    until a None text is received
+
+    :param texts: Queue of tuples with the index and text of each poem
+    :param records: Queue to put tuples with the index of each poem and the
+        list of token records of each of its stanzas
+    :param results: Queue to report errors to
+    :param split_stanzas_on: Regular expression to split texts in stanzas.
+        None for not splitting
+    :param batch_size: Maximum number of texts per spaCy batch
+    :param chunk_size: Maximum number of characters of text tagged at once.
+        None for the maximum length of the pipeline
+    """
+    try:
+        nlp = load_pipeline()
+        running = True
+        while running:
+            # Tag whatever is already waiting instead of blocking until the
+            # batch is full
+            batch = [texts.get()]
+            while batch[-1] is not None and len(batch) < batch_size:
+                try:
+                    batch.append(texts.get_nowait())
+                except queue.Empty:
+                    break
+            if batch[-1] is None:
+                batch.pop()
+                running = False
+            tagged = tag_texts([text for _, text in batch], split_stanzas_on,
+                               chunk_size, nlp=nlp)
+            for (index, _), stanzas in zip(batch, tagged):
+                records.put((index, stanzas))
+    except Exception:
+        results.put(("error", traceback.format_exc(), None))
+
+
+def _scan_stage(records, results, options):
+    """Scans token records and sends the results back, until a None record
+    is received
+
+    :param records: Queue of tuples with the index of each poem and the list
+        of token records of each of its stanzas
+    :param results: Queue to put tuples with the index and scansion of each
+        poem
+    :param options: Dictionary with the options for `get_scansion`
+    """
+    for index, stanzas in iter(records.get, None):
+        try:
+            scansion = scan_token_records(stanzas, **options)
+        except Exception:
+            results.put(("error", traceback.format_exc(), None))
+        else:
+            results.put(("result", index, scansion))
+
+
+def scan_corpus_staged(texts, rhyme_analysis=False, rhythm_format="pattern",
+                       rhythmical_lengths=None, split_stanzas_on=None,
+                       pos_output=False, always_return_rhyme=False,
+                       tagging_workers=1, scansion_workers=None,
+                       queue_size=QUEUE_SIZE, batch_size=100,
+                       max_liaison_candidates=MAX_LIAISON_CANDIDATES,
+                       chunk_size=None):
+    """Generates the scansion of a corpus of texts with separate processes
+    for tagging and for scansion. Queues between stages are bounded, so a
+    slow stage holds back the ones before it instead of piling up texts
+
+    :param texts: Iterable of full texts to be analyzed
+    :param rhyme_analysis: Specify if rhyme analysis is to be performed
+    :param rhythm_format: output format for rhythm analysis
+    :param rhythmical_lengths: List with explicit rhythmical lengths per line
+        that the analysed lines has to meet
+    :param split_stanzas_on: Regular expression to split texts in stanzas.
+        Defaults to None for not splitting.
+    :param pos_output: `True` or `False` for printing the PoS of the words
+    :param always_return_rhyme: `True` or `False` for printing rhyme pattern
+        even if no structure is detected
+    :param tagging_workers: Number of processes tagging texts with spaCy.
+        Each of them loads the pipeline
+    :param scansion_workers: Number of processes scanning the tagged texts.
+        Defaults to the number of CPUs left by the tagging processes
+    :param queue_size: Maximum number of texts waiting to be tagged, and of
+        tagged texts waiting to be scanned
+    :param batch_size: Maximum number of texts per spaCy batch inside a
+        tagging process
+    :param max_liaison_candidates: Maximum number of liaison combinations to
+        explore per line to meet its rhythmical length. None for no limit
+    :param chunk_size: Maximum number of characters of text tagged at once.
+        Longer texts are tagged in chunks of whole lines, or of whole stanzas
+        if split. Defaults to None for the maximum length of the pipeline
+    :return: Generator with the scansion of each text in input order, as
+        returned by `get_scansion`
+    :rtype: generator
+    """
+    if scansion_workers is None:
+        scansion_workers = max(1, (os.cpu_count() or 1) - tagging_workers)
+    options = dict(
+        rhyme_analysis=rhyme_analysis,
+        rhythm_format=rhythm_format,
+        rhythmical_lengths=rhythmical_lengths,
+        split_stanzas_on=split_stanzas_on,
+        pos_output=pos_output,
+        always_return_rhyme=always_return_rhyme,
+        max_liaison_candidates=max_liaison_candidates,
+    )
+    context = get_context()
+    text_queue = context.Queue(queue_size)
+    record_queue = context.Queue(queue_size)
+    result_queue = context.Queue()
+    taggers = [
+        context.Process(target=_tag_stage, daemon=True, args=(
+            text_queue, record_queue, result_queue, split_stanzas_on,
+            batch_size, chunk_size))
+        for _ in range(tagging_workers)
+    ]
+    scanners = [
+        context.Process(target=_scan_stage, daemon=True, args=(
+            record_queue, result_queue, options))
+        for _ in range(scansion_workers)
+    ]
+    # Texts sent and not yielded yet, so results waiting for an earlier one
+    # to be yielded in order cannot pile up either
+    in_flight = threading.BoundedSemaphore(
+        2 * queue_size + tagging_workers * batch_size + scansion_workers)
+    stopped = threading.Event()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                text_queue.put(item, timeout=POLL_INTERVAL)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def feed():
+        total = 0
+        try:
+            for index, text in enumerate(texts):
+                while not in_flight.acquire(timeout=POLL_INTERVAL):
+                    if stopped.is_set():
+                        return
+                if not put((index, text)):
+                    return
+                total += 1
+            for _ in taggers:
+                put(None)
+            result_queue.put(("end", total, None))
+        except Exception:
+            result_queue.put(("error", traceback.format_exc(), None))
+
+    for process in taggers + scanners:
+        process.start()
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+    try:
+        pending = {}
+        next_index = 0
+        total = None
+        while total is None or next_index < total:
+            try:
+                kind, value, scansion = result_queue.get(
+                    timeout=POLL_INTERVAL)
+            except queue.Empty:
+                if any(process.exitcode for process in taggers + scanners):
+                    raise RuntimeError("A staged engine process stopped")
+                continue
+            if kind == "error":
+                raise RuntimeError(value)
+            if kind == "end":
+                total = value
+                continue
+            pending[value] = scansion
+            while next_index in pending:
+                yield pending.pop(next_index)
+                next_index += 1
+                in_flight.release()
+        for _ in scanners:
+            record_queue.put(None)
+        for process in taggers + scanners:
+            process.join()
+    finally:
+        stopped.set()
+        feeder.join()
+        for process in taggers + scanners:
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        for stage_queue in (text_queue, record_queue, result_queue):
+            stage_queue.cancel_join_thread()
+            stage_queue.close()
@@ -1,3 +1,11 @@
+import gc
+import json
+import os
+import pickle
+from collections import OrderedDict
+from collections import namedtuple
+from threading import Lock
+
 import spacy
 from spacy.tokenizer import Tokenizer
 from spacy_affixes import AffixesMatcher
@@ -25,29 +33,324 @@ def custom_tokenizer(nlp):
                      infix_finditer=infix_re.finditer, token_match=None)
 
 
-# load_pipeline should work as a "singleton"
-_load_pipeline = {}
+# Components not used by the scansion, which only needs the tokenizer, the
+# tagger and the affixes. "vectors" stands for the table of word vectors
+PROFILES = {
+    "full": (),
+    "slim": ("ner", "parser", "vectors"),
+}
+DEFAULT_PROFILE = os.environ.get("RANTANPLAN_PIPELINE_PROFILE", "full")
+# Snapshot the pipeline loaded without any configuration is restored from
+DEFAULT_SNAPSHOT = None
+
+SNAPSHOT_META = "snapshot.json"
+SNAPSHOT_MODEL = "model"
+SNAPSHOT_AFFIXES = "affixes.pickle"
+
+PipelineInfo = namedtuple("PipelineInfo",
+                          "lang split_affixes disable memory")
+
+# load_pipeline should work as a "singleton" per configuration
+_pipelines = OrderedDict()
+_pipelines_memory = {}
+_pipelines_lock = Lock()
+_loading_locks = {}
+_pipelines_max_size = None
+
+
+def set_default_profile(profile):
+    """
+    Sets the profile of the pipelines loaded without an explicit profile
+    :param profile: Name of the profile, "full" or "slim"
+    """
+    global DEFAULT_PROFILE
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown pipeline profile: {profile}")
+    DEFAULT_PROFILE = profile
+
+
+def set_default_snapshot(path):
+    """
+    Sets the snapshot the pipeline loaded without any configuration is
+    restored from, so the scansion functions use it instead of building the
+    pipeline of the default profile
+    :param path: Directory of a snapshot saved with `save_pipeline_snapshot`,
+        or None for building the pipeline
+    """
+    global DEFAULT_SNAPSHOT
+    if path is not None:
+        get_snapshot_key(path)
+    DEFAULT_SNAPSHOT = path
 
 
-def load_pipeline(lang=None, split_affixes=True):
+def get_profile(disable):
     """
-    Loads the new pipeline with the custom tokenizer
+    Gets the profile that does not load exactly some components
+    :param disable: Names of the spaCy components not to load
+    :return: Name of the profile, or None if there is none
+    """
+    for profile, components in PROFILES.items():
+        if set(components) == set(disable):
+            return profile
+    return None
+
+
+def get_pipeline_key(lang=None, split_affixes=True, disable=None,
+                     profile=None):
+    """
+    Gets the key of a pipeline configuration in the registry of pipelines
     :param lang: Spacy language model
     :param split_affixes: Whether or not to use spacy_affixes to split words
-    :return: New custom language model
+    :param disable: Names of the spaCy components not to load
+    :param profile: Name of a profile of components not to load, "full" or
+        "slim". Defaults to the default profile
+    :return: Tuple with the language, whether affixes are split and the
+        sorted names of the components not loaded
     """
-    global _load_pipeline
     if lang is None:
         lang = 'es_core_news_md'
-    if lang not in _load_pipeline:
+    if profile is None:
+        profile = DEFAULT_PROFILE
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown pipeline profile: {profile}")
+    disable = set(disable or ()) | set(PROFILES[profile])
+    return lang, bool(split_affixes), tuple(sorted(disable))
+
+
+def get_memory_usage():
+    """
+    Gets the resident memory of the current process, if available
+    :return: Resident memory in bytes, or None if it can not be read
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def build_pipeline(lang, split_affixes=True, disable=None):
+    """
+    Builds a new pipeline with the custom tokenizer
+    :param lang: Spacy language model
+    :param split_affixes: Whether or not to use spacy_affixes to split words
+    :param disable: Names of the spaCy components not to load, including
+        "vectors" for not keeping the word vectors if no component uses them
+    :return: New custom language model
+    """
+    components = [name for name in disable or () if name != "vectors"]
+    if components:
+        nlp = spacy.load(lang, disable=components)
+    else:
         nlp = spacy.load(lang)
-        nlp.tokenizer = custom_tokenizer(nlp)
-        if split_affixes:
-            nlp.remove_pipe("affixes") if nlp.has_pipe("affixes") else None
-            suffixes = {k: v for k, v in load_affixes().items() if
-                        k.startswith(AFFIXES_SUFFIX)}
-            affixes_matcher = AffixesMatcher(nlp, split_on=["VERB", "AUX"],
-                                             rules=suffixes)
-            nlp.add_pipe(affixes_matcher, name="affixes", first=True)
-        _load_pipeline[lang] = nlp
-    return _load_pipeline[lang]
+    if "vectors" in (disable or ()):
+        remove_unused_vectors(nlp)
+    nlp.tokenizer = custom_tokenizer(nlp)
+    if split_affixes:
+        nlp.remove_pipe("affixes") if nlp.has_pipe("affixes") else None
+        suffixes = {k: v for k, v in load_affixes().items() if
+                    k.startswith(AFFIXES_SUFFIX)}
+        affixes_matcher = AffixesMatcher(nlp, split_on=["VERB", "AUX"],
+                                         rules=suffixes)
+        nlp.add_pipe(affixes_matcher, name="affixes", first=True)
+    return nlp
+
+
+def remove_unused_vectors(nlp):
+    """
+    Empties the table of word vectors of a pipeline if none of its
+    components uses them as features, since removing them would change the
+    output of the components
+    :param nlp: Spacy language model
+    :return: Whether the vectors were removed
+    """
+    for _, component in nlp.pipeline:
+        if getattr(component, "cfg", {}).get("pretrained_vectors"):
+            return False
+    nlp.vocab.reset_vectors(width=0)
+    return True
+
+
+def load_pipeline(lang=None, split_affixes=None, disable=None, profile=None,
+                  snapshot=None):
+    """
+    Loads the new pipeline with the custom tokenizer. Pipelines are loaded
+    only once per configuration, even from several threads at the same time
+    :param lang: Spacy language model
+    :param split_affixes: Whether or not to use spacy_affixes to split words.
+        Defaults to None for splitting them
+    :param disable: Names of the spaCy components not to load
+    :param profile: Name of a profile of components not to load, "full" for
+        the whole model or "slim" for just the components needed for the
+        scansion. Defaults to the default profile
+    :param snapshot: Directory of a snapshot saved with
+        `save_pipeline_snapshot` to restore the pipeline from, instead of
+        building it. The pipeline is then registered with the configuration
+        it was saved with, so later loads of that configuration return it.
+        Defaults to the default snapshot if no configuration is given
+    :return: New custom language model
+    """
+    if snapshot is None and (lang, split_affixes, disable, profile) == (
+            None, None, None, None):
+        snapshot = DEFAULT_SNAPSHOT
+    if split_affixes is None:
+        split_affixes = True
+    if snapshot is None:
+        key = get_pipeline_key(lang, split_affixes, disable, profile)
+    else:
+        key = get_snapshot_key(snapshot)
+    with _pipelines_lock:
+        if key in _pipelines:
+            _pipelines.move_to_end(key)
+            return _pipelines[key]
+        loading_lock = _loading_locks.setdefault(key, Lock())
+    with loading_lock:
+        with _pipelines_lock:
+            if key in _pipelines:
+                _pipelines.move_to_end(key)
+                return _pipelines[key]
+        memory_before = get_memory_usage()
+        if snapshot is None:
+            nlp = build_pipeline(*key)
+        else:
+            nlp = restore_pipeline(snapshot)
+        memory_after = get_memory_usage()
+        with _pipelines_lock:
+            _pipelines[key] = nlp
+            if memory_before is None or memory_after is None:
+                _pipelines_memory[key] = None
+            else:
+                _pipelines_memory[key] = max(0, memory_after - memory_before)
+            _loading_locks.pop(key, None)
+            evicted = _trim_pipelines()
+    if evicted:
+        gc.collect()
+    return nlp
+
+
+def save_pipeline_snapshot(path, lang=None, split_affixes=True, disable=None,
+                           profile=None):
+    """
+    Saves a pipeline, with the custom tokenizer and the affixes rules and
+    lexicon already prepared, to a directory that `load_pipeline` can
+    restore it from
+    :param path: Directory to save the snapshot to
+    :param lang: Spacy language model
+    :param split_affixes: Whether or not to use spacy_affixes to split words
+    :param disable: Names of the spaCy components not to load
+    :param profile: Name of a profile of components not to load
+    """
+    lang, split_affixes, disable = get_pipeline_key(lang, split_affixes,
+                                                    disable, profile)
+    nlp = load_pipeline(lang, split_affixes, disable, profile="full")
+    os.makedirs(path, exist_ok=True)
+    nlp.to_disk(os.path.join(path, SNAPSHOT_MODEL), exclude=["affixes"])
+    if split_affixes:
+        affixes = nlp.get_pipe("affixes")
+        with open(os.path.join(path, SNAPSHOT_AFFIXES), "wb") as affixes_file:
+            pickle.dump({
+                "rules": affixes.rules,
+                "lexicon": affixes.lexicon,
+                "split_on": affixes.split_on,
+            }, affixes_file, protocol=pickle.HIGHEST_PROTOCOL)
+    with open(os.path.join(path, SNAPSHOT_META), "w") as meta_file:
+        json.dump({
+            "lang": lang,
+            "split_affixes": split_affixes,
+            "disable": list(disable),
+            "spacy_version": spacy.__version__,
+        }, meta_file)
+
+
+def get_snapshot_key(path):
+    """
+    Gets the key in the registry of pipelines of the configuration a
+    snapshot was saved with
+    :param path: Directory of the snapshot
+    :return: Tuple with the language, whether affixes are split and the
+        sorted names of the components not loaded
+    """
+    with open(os.path.join(path, SNAPSHOT_META)) as meta_file:
+        meta = json.load(meta_file)
+    return meta["lang"], meta["split_affixes"], tuple(meta["disable"])
+
+
+def restore_pipeline(path):
+    """
+    Restores a pipeline saved with `save_pipeline_snapshot`. Snapshots
+    contain pickled data, so only snapshots from trusted sources must be
+    restored
+    :param path: Directory of the snapshot
+    :return: New custom language model
+    """
+    _, split_affixes, _ = get_snapshot_key(path)
+    nlp = spacy.load(os.path.join(path, SNAPSHOT_MODEL), disable=["affixes"])
+    if split_affixes:
+        with open(os.path.join(path, SNAPSHOT_AFFIXES), "rb") as affixes_file:
+            affixes = pickle.load(affixes_file)
+        affixes_matcher = AffixesMatcher(nlp, **affixes)
+        nlp.add_pipe(affixes_matcher, name="affixes", first=True)
+    return nlp
+
+
+def _trim_pipelines():
+    """
+    Removes the least recently used pipelines over the maximum size of the
+    registry. Must be called holding the registry lock
+    :return: Whether any pipeline was removed
+    """
+    evicted = False
+    while (_pipelines_max_size is not None
+           and len(_pipelines) > _pipelines_max_size):
+        key, _ = _pipelines.popitem(last=False)
+        _pipelines_memory.pop(key, None)
+        evicted = True
+    return evicted
+
+
+def set_pipelines_max_size(size):
+    """
+    Sets the maximum number of pipelines kept loaded, removing the least
+    recently used ones if needed
+    :param size: Maximum number of pipelines. None for no limit
+    """
+    global _pipelines_max_size
+    with _pipelines_lock:
+        _pipelines_max_size = size
+        evicted = _trim_pipelines()
+    if evicted:
+        gc.collect()
+
+
+def evict_pipeline(lang=None, split_affixes=True, disable=None,
+                   profile=None):
+    """
+    Removes a pipeline from the registry so its memory can be released once
+    no longer in use
+    :param lang: Spacy language model
+    :param split_affixes: Whether or not to use spacy_affixes to split words
+    :param disable: Names of the spaCy components not to load
+    :param profile: Name of a profile of components not to load
+    :return: Whether the pipeline was loaded
+    """
+    key = get_pipeline_key(lang, split_affixes, disable, profile)
+    with _pipelines_lock:
+        nlp = _pipelines.pop(key, None)
+        _pipelines_memory.pop(key, None)
+    if nlp is None:
+        return False
+    del nlp
+    gc.collect()
+    return True
+
+
+def pipelines_info():
+    """
+    Gets the pipelines loaded, from the least to the most recently used
+    :return: List of named tuples with the configuration of each pipeline
+        and the approximate memory in bytes it took to load it (None if
+        unknown)
+    """
+    with _pipelines_lock:
+        return [PipelineInfo(*key, memory=_pipelines_memory.get(key))
+                for key in _pipelines]
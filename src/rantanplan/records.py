@@ -0,0 +1,203 @@
+"""
+Compact token records.
+
+The scansion only needs a handful of features of every token tagged by
+spaCy. Token records keep just those features in a plain tuple, so they are
+cheap to pickle and send between processes, and they can be scanned without
+spaCy or the Doc they come from.
+
+Corpora already tagged can be scanned from their token records too, either
+built directly or read from CoNLL-U files, without running spaCy at all.
+"""
+from collections import namedtuple
+
+from .syllabification import SPACE
+
+# Fine-grained tag of the whitespace tokens, as given by spaCy
+SPACE_TAG = "_SP"
+# Escape sequences of the SpacesAfter and SpacesBefore fields of CoNLL-U
+CONLLU_SPACES = {"s": " ", "t": "\t", "n": "\n", "r": "\r", "p": "|",
+                 "\\": "\\"}
+
+
+class TokenRecord(namedtuple("TokenRecord",
+                             "text pos_ tag_ affixes_length whitespace_")):
+    """Token features needed for the scansion, with the same attribute names
+    as a spaCy `Token` so both can be scanned alike
+
+    :param text: Text of the token
+    :param pos_: Universal part of speech tag (UPOS), "SPACE" for whitespace
+        tokens. Whitespace tokens containing a newline mark the end of a line
+    :param tag_: Morphological features, as in
+        "Mood=Ind|Number=Sing|Person=3"
+    :param affixes_length: For a verb split from its enclitic pronouns, the
+        number of tokens of those pronouns, which follow it. None otherwise
+    :param whitespace_: Trailing whitespace of the token
+    """
+    __slots__ = ()
+
+    @property
+    def orth_(self):
+        return self.text
+
+    @property
+    def is_alpha(self):
+        return self.text.isalpha()
+
+    @property
+    def _(self):
+        # Custom attributes such as `token._.affixes_length`
+        return self
+
+
+def get_token_record(token):
+    """Gets the record of a spaCy token
+
+    :param token: spaCy `Token`
+    :return: Record with the features of the token
+    :rtype: TokenRecord
+    """
+    return TokenRecord(token.text, token.pos_, token.tag_,
+                       getattr(token._, "affixes_length", None),
+                       token.whitespace_)
+
+
+def get_token_records(tokens):
+    """Gets the records of a spaCy `Doc` or any sequence of tokens
+
+    :param tokens: spaCy `Doc` or sequence of tokens
+    :return: List of records with the features of the tokens
+    :rtype: list
+    """
+    return [get_token_record(token) for token in tokens]
+
+
+def get_space_record(text):
+    """Gets the record of a whitespace token
+
+    :param text: Whitespace, a newline marks the end of a line
+    :return: Record of a whitespace token
+    :rtype: TokenRecord
+    """
+    return TokenRecord(text, SPACE, SPACE_TAG, None, "")
+
+
+def _unescape_conllu_spaces(spaces):
+    """Replaces the escape sequences of a CoNLL-U SpacesAfter field"""
+    output = []
+    characters = iter(spaces)
+    for character in characters:
+        if character == "\\":
+            character = CONLLU_SPACES.get(next(characters, ""), "")
+        output.append(character)
+    return "".join(output)
+
+
+def _get_conllu_records(form, words, misc):
+    """Gets the records of a CoNLL-U token
+
+    :param form: Surface form of the token
+    :param words: List of tuples with the form, UPOS and FEATS of each of
+        the syntactic words of the token, more than one for multiword tokens
+    :param misc: MISC field of the token
+    :return: List of token records, followed by a whitespace record if the
+        token ends a line
+    :rtype: list
+    """
+    misc = dict(field.partition("=")[::2]
+                for field in misc.split("|") if field != "_")
+    if "SpacesAfter" in misc:
+        spaces = _unescape_conllu_spaces(misc["SpacesAfter"])
+    else:
+        spaces = "" if misc.get("SpaceAfter") == "No" else " "
+    whitespace = " " if spaces.startswith(" ") else ""
+    _, pos, tag = words[0]
+    if len(words) > 1 and pos in ("AUX", "VERB"):
+        # Verbs with enclitic pronouns are split like spaCy affixes does,
+        # keeping the surface form (and so its accents) of every part
+        affixes = [word[0] for word in words[1:]]
+        affixes_text = "".join(affixes)
+        if (len(form) > len(affixes_text)
+                and form.lower().endswith(affixes_text.lower())):
+            parts = [form[:len(form) - len(affixes_text)]]
+            start = len(parts[0])
+            for affix in affixes:
+                parts.append(form[start:start + len(affix)])
+                start += len(affix)
+        else:
+            parts = [word[0] for word in words]
+        records = [TokenRecord(parts[0], pos, tag, len(affixes), "")]
+        records += [
+            TokenRecord(part, word_pos, word_tag, None, "")
+            for part, (_, word_pos, word_tag) in zip(parts[1:], words[1:])
+        ]
+        records[-1] = records[-1]._replace(whitespace_=whitespace)
+    else:
+        # Other multiword tokens, such as contractions, are kept whole
+        records = [TokenRecord(form, pos, tag, None, whitespace)]
+    if "\n" in spaces:
+        records.append(get_space_record(spaces[len(whitespace):]))
+    return records
+
+
+def read_conllu(lines, sentence_lines=False):
+    """Reads the token records of the documents of a CoNLL-U file. Lines of
+    verse end at the tokens with a newline in their SpacesAfter field (as
+    written by UDPipe), and documents start at the "# newdoc" comments.
+    Verbs with enclitic pronouns must be multiword tokens, as in
+    "dámelo", split in "da", "me" and "lo"
+
+    :param lines: Iterable of the lines of the file
+    :param sentence_lines: `True` for also ending a line of verse at the end
+        of every sentence, for files without newlines in SpacesAfter
+    :return: Generator with the list of token records of each document
+    :rtype: generator
+    """
+    records = []
+    multiword = None
+
+    def end_line():
+        if records and records[-1].pos_ != SPACE:
+            records.append(get_space_record("\n"))
+
+    def get_document():
+        while records and records[-1].pos_ == SPACE:
+            records.pop()
+        document = records[:]
+        records.clear()
+        return document
+
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if line.startswith("#"):
+            if line[1:].split()[:1] == ["newdoc"]:
+                document = get_document()
+                if document:
+                    yield document
+            continue
+        if not line.strip():
+            if sentence_lines:
+                end_line()
+            continue
+        token_id, form, _, pos, _, tag, *_, misc = line.split("\t")
+        pos = "" if pos == "_" else pos
+        tag = "" if tag == "_" else tag
+        if "." in token_id:
+            # Empty nodes have no surface form
+            continue
+        if "-" in token_id:
+            end = int(token_id.split("-")[1])
+            multiword = (end, form, misc, [])
+        elif multiword is not None and int(token_id) <= multiword[0]:
+            end, multiword_form, multiword_misc, words = multiword
+            words.append((form, pos, tag))
+            if int(token_id) == end:
+                records.extend(_get_conllu_records(multiword_form, words,
+                                                   multiword_misc))
+                multiword = None
+        else:
+            records.extend(_get_conllu_records(form, [(form, pos, tag)],
+                                               misc))
+    document = get_document()
+    if document:
+        yield document
@@ -2,6 +2,7 @@
 import re
 import string
 from collections import Counter
+from functools import lru_cache
 
 from spacy_affixes.utils import strip_accents
 
@@ -252,25 +253,69 @@ def get_rhymes(stressed_endings, assonance=False, relaxation=False,
     return rhymes, unstressed_endings, stresses
 
 
-def search_structure(rhyme, length_ranges, structure_key, structures=None):
+def compile_structures(structures):
+    """Compile the regular expressions of a list of stanza structures and
+    group the structures by rhyme type (assonance or consonance). Each
+    structure is turned into a tuple with its index, a callable that checks the
+    rhyme pattern, and the condition on the lengths of syllables of lines."""
+    compiled_structures = {}
+    for index, (key, _, structure, func) in enumerate(structures):
+        if callable(structure):
+            structure_check = structure
+        else:  # it's a regex
+            structure_check = re.compile(structure, re.VERBOSE).fullmatch
+        compiled_structures.setdefault(key, []).append(
+            (index, structure_check, func)
+        )
+    return compiled_structures
+
+
+COMPILED_STRUCTURES = compile_structures(STRUCTURES)
+# Maximum number of distinct rhyme patterns whose matching structures are kept
+RHYME_PATTERNS_CACHE_SIZE = 2 ** 14
+
+
+@lru_cache(maxsize=RHYME_PATTERNS_CACHE_SIZE)
+def get_matching_structures(rhyme, structure_key):
+    """Return a tuple with the indices in STRUCTURES of the structures of a
+    rhyme type whose rhyme pattern (regex or callable) matches a rhyme. Since
+    the rhyme pattern is normalized so the first rhyme is always an 'a',
+    results are memoized per rhyme pattern and the structures are only checked
+    the first time a rhyme pattern is seen."""
+    return tuple(
+        index
+        for index, structure_check, _ in COMPILED_STRUCTURES.get(
+            structure_key, ())
+        if structure_check(rhyme)
+    )
+
+
+def search_structure(rhyme, length_ranges, structure_key, structures=None,
+                     first_match=False):
     """Search in stanza structures for a structure that matches assonance or
     consonance, a rhyme pattern (regex or callable), and a condition on the
     lengths of syllables of lines. For the first matching structure, its index
     in STRUCTURES will be returned. An alternative STRUCTURES list can be passed
-    in structures."""
+    in structures. If first_match is True, the search stops at the first
+    matching structure."""
     if structures is None:
-        structures = STRUCTURES
+        candidates = (
+            (index, STRUCTURES[index][3])
+            for index in get_matching_structures(rhyme, structure_key)
+        )
+    else:
+        candidates = (
+            (index, func)
+            for index, structure_check, func in compile_structures(
+                structures).get(structure_key, ())
+            if structure_check(rhyme)
+        )
     indices = []
-    for index, (key, _, structure, func) in enumerate(structures):
-        if callable(structure):
-            structure_check = structure(rhyme)
-        else:  # it's a regex
-            structure_re = re.compile(structure, re.VERBOSE)
-            structure_check = structure_re.fullmatch(rhyme)
-        if (key == structure_key
-                and structure_check
-                and func(length_ranges)):
+    for index, func in candidates:
+        if func(length_ranges):
             indices.append(index)
+            if first_match:
+                break
     return indices
 
 
@@ -301,7 +346,8 @@ def analyze_rhyme(lines, offset=4, always_return_rhyme=False):
                 "rhyme_type": rhyme_type,
                 "rhyme_relaxation": relaxation
             }
-            candidates = search_structure(rhyme, length_ranges, rhyme_type)
+            candidates = search_structure(rhyme, length_ranges, rhyme_type,
+                                          first_match=True)
             if len(candidates):
                 ranking, *_ = candidates
             else:
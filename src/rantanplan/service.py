@@ -0,0 +1,367 @@
+"""
+Scansion service over HTTP on localhost with request micro-batching.
+
+Concurrent requests are gathered in micro-batches that are tagged with a
+single call to spaCy's `nlp.pipe`, and the token records of every tagged text
+are then handed to a pool of workers to be scanned. The service only uses
+the standard library and always listens on the loopback interface.
+
+Endpoints:
+
+- ``POST /scansion`` with a JSON object holding the ``text`` to scan and
+  optionally the ``options`` for `get_scansion`
+- ``GET /metrics/latency`` with the p50, p95 and p99 latencies in
+  milliseconds of the latest requests
+- ``GET /metrics/queue`` with the number of requests waiting to be batched
+  and being processed
+"""
+import asyncio
+import json
+import math
+import re
+import time
+from collections import defaultdict
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from http import HTTPStatus
+from multiprocessing import get_context
+
+from .core import join_chunk_stanzas
+from .core import pipe_chunks
+from .core import scan_token_records
+from .core import tag_stanzas
+from .pipeline import load_pipeline
+
+HOST = "127.0.0.1"
+PORT = 8000
+MAX_BATCH_SIZE = 64
+MAX_WAIT_MS = 10
+# Number of latest requests the latency percentiles are computed on
+LATENCY_WINDOW = 10000
+SCANSION_OPTIONS = {
+    "rhyme_analysis", "rhythm_format", "rhythmical_lengths",
+    "split_stanzas_on", "pos_output", "always_return_rhyme",
+    "max_liaison_candidates",
+}
+
+
+def percentile(values, percent):
+    """Gets a percentile of a list of values using the nearest-rank method
+
+    :param values: List of numbers
+    :param percent: Percentile to get, from 0 to 100
+    :return: The percentile, or None if there are no values
+    :rtype: float
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(0, math.ceil(percent / 100 * len(values)) - 1)]
+
+
+class ScansionService:
+    """HTTP service that scans texts in micro-batches
+
+    :param max_batch_size: Maximum number of requests per batch
+    :param max_wait_ms: Maximum time in milliseconds the first request of a
+        batch waits for more requests to come
+    :param workers: Number of threads of the worker pool. Defaults to the
+        `ThreadPoolExecutor` default
+    :param executor: Executor to scan the tagged texts with, such as a pool
+        of processes made with `make_worker_pool`, instead of a new pool of
+        threads. Batches are always tagged in a thread of this process, which
+        holds the pipeline. Forked workers must be started before serving, or
+        they keep the connections open
+    :param chunk_size: Maximum number of characters of text tagged at once.
+        Longer texts are tagged in chunks of whole lines, or of whole stanzas
+        if split. Defaults to None for the maximum length of the pipeline
+    """
+
+    def __init__(self, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS,
+                 workers=None, executor=None, chunk_size=None):
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.chunk_size = chunk_size
+        self.executor = executor or ThreadPoolExecutor(workers)
+        self.tagger = ThreadPoolExecutor(1)
+        self.nlp = load_pipeline()
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.pending = 0
+        self.queue = None
+        self.server = None
+        self.batcher = None
+
+    async def start(self, port=PORT):
+        """Starts serving requests on localhost
+
+        :param port: TCP port to listen on. 0 for any free port
+        :return: The server
+        :rtype: asyncio.AbstractServer
+        """
+        self.queue = asyncio.Queue()
+        self.batcher = asyncio.ensure_future(self.run_batches())
+        self.server = await asyncio.start_server(self.handle_connection,
+                                                 HOST, port)
+        return self.server
+
+    async def close(self):
+        """Stops serving requests"""
+        self.server.close()
+        await self.server.wait_closed()
+        self.batcher.cancel()
+        self.tagger.shutdown(wait=False)
+
+    async def scan(self, text, options=None):
+        """Scans a text as part of the next batch
+
+        :param text: Full text to be analyzed
+        :param options: Dictionary with the options for `get_scansion`
+        :return: The scansion of the text, as returned by `get_scansion`
+        :rtype: list
+        """
+        future = asyncio.get_running_loop().create_future()
+        start = time.perf_counter()
+        self.pending += 1
+        try:
+            await self.queue.put((text, options or {}, future))
+            return await future
+        finally:
+            self.pending -= 1
+            self.latencies.append((time.perf_counter() - start) * 1000)
+
+    async def run_batches(self):
+        """Gathers queued requests in batches, tags every batch and sends
+        the token records of each tagged text to the worker pool, forever"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait_ms / 1000
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(
+                        await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            batch = [request for request in batch if not request[2].done()]
+            if not batch:
+                continue
+            try:
+                batch_stanzas = await loop.run_in_executor(
+                    self.tagger, self.tag, batch)
+            except Exception as error:
+                for *_, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            for (text, options, future), stanzas in zip(batch, batch_stanzas):
+                if isinstance(stanzas, Exception):
+                    if not future.done():
+                        future.set_exception(stanzas)
+                    continue
+                scansion = loop.run_in_executor(
+                    self.executor, partial(scan_token_records, stanzas,
+                                           **options))
+                scansion.add_done_callback(
+                    lambda scansion, future=future: _copy_result(scansion,
+                                                                 future))
+
+    def tag(self, batch):
+        """Tags the texts of a batch of requests with a single `nlp.pipe` call
+        per stanza separator, in chunks if they are too long
+
+        :param batch: List of tuples with the text, options and future of each
+            request
+        :return: List with the list of token records of each request, one
+            per stanza if the text is split in stanzas, or the exception
+            raised while splitting it so only that request fails
+        :rtype: list
+        """
+        batch_stanzas = [[] for _ in batch]
+        positions = defaultdict(list)
+        for position, (_, options, _) in enumerate(batch):
+            positions[options.get("split_stanzas_on")].append(position)
+        for split_stanzas_on, group in positions.items():
+            chunks = pipe_chunks(self.nlp, [batch[position][0]
+                                            for position in group],
+                                 split_stanzas_on, self.chunk_size)
+            for index, doc in chunks:
+                stanzas = batch_stanzas[group[index]]
+                if isinstance(stanzas, Exception):
+                    continue
+                try:
+                    stanzas.extend(
+                        tag_stanzas([doc], split_stanzas_on, self.nlp))
+                except Exception as error:
+                    batch_stanzas[group[index]] = error
+            for position in group:
+                if not isinstance(batch_stanzas[position], Exception):
+                    batch_stanzas[position] = join_chunk_stanzas(
+                        batch_stanzas[position], split_stanzas_on)
+        return batch_stanzas
+
+    def get_latency(self):
+        """Gets the latency percentiles of the latest requests
+
+        :return: Dictionary with the number of requests and the p50, p95 and
+            p99 latencies in milliseconds
+        :rtype: dict
+        """
+        latencies = list(self.latencies)
+        return {
+            "count": len(latencies),
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+        }
+
+    def get_queue(self):
+        """Gets the depth of the queue of requests
+
+        :return: Dictionary with the number of requests waiting to be batched
+            and the number of requests not answered yet
+        :rtype: dict
+        """
+        return {"queue_depth": self.queue.qsize(), "pending": self.pending}
+
+    async def route(self, method, path, body):
+        """Answers an HTTP request
+
+        :param method: HTTP method
+        :param path: Path of the request
+        :param body: Bytes of the body of the request
+        :return: Status and JSON serializable content of the response
+        :rtype: tuple
+        """
+        routes = {
+            "/scansion": "POST",
+            "/metrics/latency": "GET",
+            "/metrics/queue": "GET",
+        }
+        if path not in routes:
+            return HTTPStatus.NOT_FOUND, {"error": "Not found"}
+        if method != routes[path]:
+            return HTTPStatus.METHOD_NOT_ALLOWED, {"error": "Not allowed"}
+        if path == "/metrics/latency":
+            return HTTPStatus.OK, self.get_latency()
+        if path == "/metrics/queue":
+            return HTTPStatus.OK, self.get_queue()
+        try:
+            request = json.loads(body)
+            text = request["text"]
+            options = request.get("options", {})
+            if not isinstance(text, str) or not isinstance(options, dict):
+                raise ValueError("text must be a string and options an object")
+            unknown_options = set(options) - SCANSION_OPTIONS
+            if unknown_options:
+                raise ValueError(
+                    f"Unknown options: {', '.join(sorted(unknown_options))}")
+            if options.get("split_stanzas_on") is not None:
+                re.compile(options["split_stanzas_on"])
+        except (ValueError, KeyError, TypeError, re.error) as error:
+            return HTTPStatus.BAD_REQUEST, {"error": f"Bad request: {error}"}
+        try:
+            return HTTPStatus.OK, await self.scan(text, options)
+        except Exception as error:
+            return (HTTPStatus.INTERNAL_SERVER_ERROR,
+                    {"error": f"{type(error).__name__}: {error}"})
+
+    async def handle_connection(self, reader, writer):
+        """Answers the HTTP/1.1 requests of a connection"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, path, version = request_line.decode("latin-1").split()
+                headers = {}
+                while True:
+                    header = await reader.readline()
+                    if not header.strip():
+                        break
+                    name, _, value = header.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(
+                    int(headers.get("content-length", 0)))
+                status, content = await self.route(method, path, body)
+                keep_alive = (version == "HTTP/1.1"
+                              and headers.get("connection") != "close")
+                payload = json.dumps(content, ensure_ascii=False).encode()
+                writer.write(
+                    f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(payload)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}"
+                    f"\r\n\r\n".encode("latin-1") + payload
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+def _copy_result(source, destination):
+    """Sets the result or exception of a future on another future, unless
+    the latter is already done (e.g. cancelled)"""
+    if destination.done():
+        return
+    if source.exception() is not None:
+        destination.set_exception(source.exception())
+    else:
+        destination.set_result(source.result())
+
+
+def make_worker_pool(workers=None, processes=False):
+    """Creates the pool of workers scanning the tagged texts. The scansion
+    is pure Python and holds the GIL, so only processes scan in parallel
+
+    :param workers: Number of workers. Defaults to the executor default
+    :param processes: `True` for a pool of forked processes, which are all
+        started right away so they hold no connections open, or `False` for
+        a pool of threads
+    :return: The executor
+    :rtype: concurrent.futures.Executor
+    """
+    if not processes:
+        return ThreadPoolExecutor(workers)
+    executor = ProcessPoolExecutor(workers, mp_context=get_context("fork"))
+    # Forked processes are all started with the first task
+    executor.submit(int).result()
+    return executor
+
+
+def serve(port=PORT, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS,
+          workers=None, processes=False):
+    """Loads the pipeline and serves scansion requests over HTTP on localhost
+    until interrupted
+
+    :param port: TCP port to listen on
+    :param max_batch_size: Maximum number of requests per batch
+    :param max_wait_ms: Maximum time in milliseconds the first request of a
+        batch waits for more requests to come
+    :param workers: Number of workers of the worker pool
+    :param processes: `True` for scanning in worker processes, or `False` for
+        worker threads
+    """
+    # Processes are forked before the service starts its tagging thread,
+    # and unless restored from a snapshot, before the pipeline is loaded
+    executor = make_worker_pool(workers, processes)
+
+    async def run():
+        service = ScansionService(max_batch_size, max_wait_ms,
+                                  executor=executor)
+        server = await service.start(port)
+        try:
+            await server.serve_forever()
+        finally:
+            await service.close()
+
+    with executor:
+        asyncio.run(run())
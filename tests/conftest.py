@@ -0,0 +1,76 @@
+import threading
+import time
+
+import pytest
+import spacy
+
+
+class FakeNLP:
+    """Blank Spanish pipeline that records the texts of every batch it tags,
+    and whether two threads ever tag at the same time"""
+
+    def __init__(self, delay=0):
+        self.nlp = spacy.blank("es")
+        self.delay = delay
+        self.batches = []
+        self.overlapped = False
+        self._tagging = threading.Lock()
+
+    @property
+    def max_length(self):
+        return self.nlp.max_length
+
+    @max_length.setter
+    def max_length(self, max_length):
+        self.nlp.max_length = max_length
+
+    def __call__(self, text):
+        return next(self.pipe([text]))
+
+    def pipe(self, texts, **kwargs):
+        texts = list(texts)
+        if self._tagging.acquire(blocking=False):
+            try:
+                time.sleep(self.delay)
+            finally:
+                self._tagging.release()
+        else:
+            self.overlapped = True
+        self.batches.append(texts)
+        return self.nlp.pipe(texts)
+
+
+def _fake_get_scansion(text, **options):
+    if not isinstance(text, str):
+        # Tokens or token records
+        text = "".join(token.text + token.whitespace_ for token in text)
+        text = text.strip()
+    if text == "error":
+        raise ValueError("scansion failed")
+    time.sleep(float(options.get("delay", 0)))
+    return [{"text": text, "options": options}]
+
+
+def _fake_get_scansion_batch(texts, **options):
+    for text in texts:
+        yield _fake_get_scansion(text, **options)
+
+
+@pytest.fixture
+def fake_nlp():
+    return FakeNLP()
+
+
+@pytest.fixture
+def fake_get_scansion():
+    """Scansion of a text, or of its tokens, as a single line with the text
+    and the options given. Fails for "error" and waits for the delay option
+    """
+    return _fake_get_scansion
+
+
+@pytest.fixture
+def fake_get_scansion_batch():
+    """Scansion of several texts as given by the `fake_get_scansion` fixture
+    """
+    return _fake_get_scansion_batch
@@ -0,0 +1,85 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from rantanplan.aio import get_scansion_async
+from rantanplan.aio import get_scansion_batch_async
+from rantanplan.aio import make_executor
+from rantanplan.core import get_scansion
+
+
+async def async_texts(texts):
+    for text in texts:
+        yield text
+
+
+async def collect(scansions):
+    return [scansion async for scansion in scansions]
+
+
+@pytest.fixture
+def fake_scansion(monkeypatch, fake_nlp, fake_get_scansion):
+    monkeypatch.setattr("rantanplan.core.load_pipeline", lambda: fake_nlp)
+    monkeypatch.setattr("rantanplan.core._get_scansion", fake_get_scansion)
+    return fake_nlp
+
+
+def test_get_scansion_async(fake_scansion):
+    scansion = asyncio.run(get_scansion_async("uno", rhyme_analysis=True))
+    assert scansion == [{"text": "uno", "options": {"rhyme_analysis": True}}]
+
+
+def test_get_scansion_async_timeout(fake_scansion):
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(get_scansion_async("uno", timeout=0.01, delay=0.5))
+
+
+def test_get_scansion_async_serial_tagging(fake_scansion):
+    async def scan(texts, executor):
+        return await asyncio.gather(*(
+            get_scansion_async(text, executor) for text in texts))
+
+    fake_scansion.delay = 0.05
+    texts = ["uno", "dos", "tres", "cuatro"]
+    with make_executor(4) as executor:
+        scansions = asyncio.run(scan(texts, executor))
+    assert scansions == [[{"text": text, "options": {}}] for text in texts]
+    assert not fake_scansion.overlapped
+
+
+def test_get_scansion_batch_async(fake_scansion):
+    texts = [str(index) for index in range(10)]
+    with make_executor(2) as executor:
+        for source in (texts, async_texts(texts)):
+            scansions = asyncio.run(collect(get_scansion_batch_async(
+                source, executor, texts_per_chunk=3, rhyme_analysis=True)))
+            assert scansions == [
+                [{"text": text, "options": {"rhyme_analysis": True}}]
+                for text in texts
+            ]
+    assert not fake_scansion.overlapped
+
+
+def test_get_scansion_batch_async_timeout(fake_scansion):
+    scansions = get_scansion_batch_async(["uno"], timeout=0.01, delay=0.5)
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(collect(scansions))
+
+
+def test_get_scansion_async_pipeline():
+    texts = [
+        "Noche sin luna.\nLa tempestad estruja\nlos viejos cedros.",
+        "Me gustas cuando callas porque estás como ausente,",
+    ]
+    scansion = asyncio.run(get_scansion_async(texts[0], rhyme_analysis=True))
+    assert scansion == get_scansion(texts[0], rhyme_analysis=True)
+    with make_executor(1, processes=True) as executor:
+        scansions = asyncio.run(collect(get_scansion_batch_async(
+            texts, executor, texts_per_chunk=1)))
+    assert scansions == [get_scansion(text) for text in texts]
+
+
+def test_make_executor():
+    with make_executor(1, processes=True) as executor:
+        assert isinstance(executor, ProcessPoolExecutor)
@@ -0,0 +1,27 @@
+import rantanplan.pipeline
+from rantanplan.benchmark import benchmark_profile
+from rantanplan.pipeline import get_pipeline_key
+
+
+def test_benchmark_profile(monkeypatch, fake_nlp, fake_get_scansion_batch):
+    def fake_load_pipeline():
+        loaded.append(get_pipeline_key())
+        return fake_nlp
+
+    loaded = []
+    monkeypatch.setattr(rantanplan.pipeline, "DEFAULT_PROFILE", "full")
+    monkeypatch.setattr(rantanplan.pipeline, "DEFAULT_SNAPSHOT", None)
+    monkeypatch.setattr("rantanplan.benchmark.load_pipeline",
+                        fake_load_pipeline)
+    monkeypatch.setattr("rantanplan.benchmark.get_scansion_batch",
+                        fake_get_scansion_batch)
+    full = benchmark_profile(["uno dos", "tres"])
+    slim = benchmark_profile(["uno dos", "tres"], "slim")
+    assert (full["profile"], slim["profile"]) == ("full", "slim")
+    assert [disable for *_, disable in loaded] == [
+        (), ("ner", "parser", "vectors")]
+    assert full["tokens"] == slim["tokens"] == 3
+    assert full["scansion_digest"] == slim["scansion_digest"]
+    assert set(full) == {
+        "profile", "snapshot", "load_seconds", "pipeline_memory", "memory",
+        "tokens", "tokens_per_second", "scansion_digest"}
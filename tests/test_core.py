@@ -6,28 +6,56 @@ import pytest
 import spacy
 
 import rantanplan.core
+from rantanplan.core import LINE_CACHE_SIZE
+from rantanplan.core import SYLLABIFY_CACHE_SIZE
 from rantanplan.core import _get_scansion
+from rantanplan.core import adjust_stresses
 from rantanplan.core import apply_exception_rules
 from rantanplan.core import apply_exception_rules_post
+from rantanplan.core import break_on_h
 from rantanplan.core import clean_phonological_groups
+from rantanplan.core import clear_line_cache
+from rantanplan.core import clear_syllabify_cache
+from rantanplan.core import find_phonological_groups
 from rantanplan.core import format_stress
+from rantanplan.core import generate_liaison_combinations
 from rantanplan.core import generate_liaison_positions
 from rantanplan.core import generate_phonological_groups
+from rantanplan.core import get_compact_groups
 from rantanplan.core import get_last_syllable
+from rantanplan.core import get_line_scansion
 from rantanplan.core import get_orthographic_accent
 from rantanplan.core import get_phonological_groups
 from rantanplan.core import get_rhythmical_pattern
 from rantanplan.core import get_scansion
+from rantanplan.core import get_scansion_batch
+from rantanplan.core import get_stanzas
 from rantanplan.core import get_stresses
 from rantanplan.core import get_syllables_word_end
+from rantanplan.core import get_token_lines
 from rantanplan.core import get_word_stress
 from rantanplan.core import get_words
 from rantanplan.core import has_single_liaisons
 from rantanplan.core import have_prosodic_liaison
+from rantanplan.core import hyphenate_letter_clusters
 from rantanplan.core import is_paroxytone
+from rantanplan.core import iter_scansion
+from rantanplan.core import iter_text_chunks
+from rantanplan.core import join_compact_groups
+from rantanplan.core import line_cache_info
+from rantanplan.core import load_line_cache
 from rantanplan.core import remove_exact_length_matches
+from rantanplan.core import save_line_cache
+from rantanplan.core import set_line_cache_size
+from rantanplan.core import set_syllabify_cache_size
 from rantanplan.core import spacy_tag_to_dict
 from rantanplan.core import syllabify
+from rantanplan.core import syllabify_cache_info
+from rantanplan.core import tag_lines
+from rantanplan.core import tag_stanzas
+from rantanplan.core import tag_texts
+from rantanplan.records import TokenRecord
+from rantanplan.records import get_token_records
 
 nlp = spacy.load('es_core_news_md')
 
@@ -151,6 +179,55 @@ def test_syllabify_exceptions_prefix_sin_consonant():
     assert syllabify(word)[0] == output
 
 
+def test_hyphenate_letter_clusters():
+    assert hyphenate_letter_clusters("desentender") == "de-sen-ten-der"
+    assert hyphenate_letter_clusters("des-tapar") == "des-ta-par"
+
+
+def test_syllabify_cache():
+    clear_syllabify_cache()
+    syllables, _ = syllabify("patata")
+    syllables.append("modified")
+    assert syllabify("patata")[0] == ["pa", "ta", "ta"]
+    syllabify("patata", alternative_syllabification=True)
+    info = syllabify_cache_info()
+    assert (info.hits, info.misses, info.currsize) == (1, 2, 2)
+
+
+def test_set_syllabify_cache_size():
+    set_syllabify_cache_size(1)
+    syllabify("patata")
+    syllabify("cebolla")
+    info = syllabify_cache_info()
+    assert (info.maxsize, info.currsize) == (1, 1)
+    set_syllabify_cache_size(SYLLABIFY_CACHE_SIZE)
+
+
+def test_line_cache(tmp_path):
+    tokens = list(nlp("tu lloraste aunque yo"))
+    output = get_line_scansion(tokens)
+    set_line_cache_size(LINE_CACHE_SIZE)
+    clear_line_cache()
+    assert get_line_scansion(tokens) == output
+    cached_line = get_line_scansion(tokens)
+    cached_line["tokens"].clear()
+    assert get_line_scansion(tokens) == output
+    assert get_line_scansion(tokens, rhythm_format="binary") != output
+    info = line_cache_info()
+    assert (info.hits, info.misses, info.currsize) == (2, 2, 2)
+    path = tmp_path / "lines.jsonl"
+    save_line_cache(path)
+    clear_line_cache()
+    load_line_cache(path)
+    assert get_line_scansion(tokens) == output
+    info = line_cache_info()
+    assert (info.hits, info.misses, info.currsize) == (1, 0, 2)
+    set_line_cache_size(1)
+    assert line_cache_info().currsize == 1
+    set_line_cache_size(0)
+    clear_line_cache()
+
+
 def test_syllabify_tl():
     word = "atlante"
     output = ['a', 'tlan', 'te']
@@ -967,6 +1044,59 @@ def test_generate_phonological_groups(phonological_groups):
     assert list(generate_phonological_groups(tokens)) == phonological_groups
 
 
+def test_generate_phonological_groups_target_length(phonological_groups):
+    tokens = nlp("el perro hace aguas")
+    candidates = list(generate_phonological_groups(tokens, target_length=5))
+    assert len(candidates) < len(phonological_groups)
+    assert [
+        candidate for candidate in candidates
+        if get_rhythmical_pattern(candidate)["length"] == 5
+    ] == [
+        candidate for candidate in phonological_groups
+        if get_rhythmical_pattern(candidate)["length"] == 5
+    ]
+
+
+def test_find_phonological_groups(phonological_groups):
+    tokens = nlp("el perro hace aguas")
+    for length in (5, 6, 7):
+        assert find_phonological_groups(tokens, length) == next(
+            candidate for candidate in phonological_groups
+            if get_rhythmical_pattern(candidate)["length"] == length
+        )
+    assert find_phonological_groups(tokens, 20) is None
+    assert find_phonological_groups(tokens, 7, max_candidates=0) is None
+
+
+def test_get_compact_groups():
+    syllables = [
+        {'syllable': 'el', 'is_stressed': False, 'is_word_end': True},
+        {'syllable': 'hom', 'is_stressed': True},
+        {'syllable': 'bre', 'is_stressed': False, 'is_word_end': True},
+    ]
+    output = [(False, True, False), (True, False, True), (False, True, False)]
+    assert get_compact_groups(syllables) == output
+
+
+def test_join_compact_groups():
+    words = [
+        {'syllable': 'tu', 'is_stressed': False},
+        {'syllable': 'lló', 'is_stressed': True, 'has_synalepha': True,
+         'is_word_end': True},
+        {'syllable': 'a', 'is_stressed': False, 'has_synalepha': True,
+         'is_word_end': True},
+        {'syllable': 'un', 'is_stressed': True, 'is_word_end': True},
+        {'syllable': 'Du', 'is_stressed': True},
+        {'syllable': 'que', 'is_stressed': False, 'is_word_end': True},
+    ]
+    liaison_positions = [0, 1, 1, 0, 0, 0]
+    groups = get_phonological_groups(
+        words, liaison_positions=liaison_positions)
+    assert join_compact_groups(
+        get_compact_groups(words), liaison_positions=liaison_positions
+    ) == get_compact_groups(groups)
+
+
 def test_generate_liaison_positions_synalepha():
     syllables = [
         {'syllable': 'el', 'is_stressed': False, 'is_word_end': True},
@@ -987,6 +1117,61 @@ def test_generate_liaison_positions_synalepha():
         generate_liaison_positions(syllables, liaison="synalepha")) == output
 
 
+def test_generate_liaison_positions_groups_range():
+    syllables = [
+        {'syllable': 'el', 'is_stressed': False, 'is_word_end': True},
+        {'syllable': 'pe', 'is_stressed': True},
+        {'syllable': 'rro', 'is_stressed': False, 'has_synalepha': True,
+         'is_word_end': True}, {'syllable': 'ha', 'is_stressed': True},
+        {'syllable': 'ce', 'is_stressed': False, 'has_synalepha': True,
+         'is_word_end': True}, {'syllable': 'a', 'is_stressed': True},
+        {'syllable': 'guas', 'is_stressed': False, 'is_word_end': True}
+    ]
+    assert list(generate_liaison_positions(
+        syllables, liaison="synalepha", min_groups=6)) == [
+        [0, 0, 1, 0, 0, 0, 0],
+        [0, 0, 0, 0, 1, 0, 0],
+        [0, 0, 0, 0, 0, 0, 0]
+    ]
+    assert list(generate_liaison_positions(
+        syllables, liaison="synalepha", max_groups=6)) == [
+        [0, 0, 1, 0, 1, 0, 0],
+        [0, 0, 1, 0, 0, 0, 0],
+        [0, 0, 0, 0, 1, 0, 0]
+    ]
+    assert list(generate_liaison_positions(
+        syllables, liaison="synalepha", breakage_func=break_on_h,
+        min_groups=6, max_groups=6)) == [
+        [0, 0, 1, 0, 1, 0, 0],
+        [0, 0, 0, 0, 1, 0, 0]
+    ]
+
+
+def test_generate_liaison_combinations():
+    assert list(generate_liaison_combinations([1, 1, 1], [0, 0, 0])) == [
+        (1, 1, 1), (1, 1, 0), (1, 0, 1), (1, 0, 0),
+        (0, 1, 1), (0, 1, 0), (0, 0, 1), (0, 0, 0)
+    ]
+    assert list(generate_liaison_combinations(
+        [1, 1, 1], [0, 0, 0], max_removals=2, min_removals=1)) == [
+        (1, 1, 0), (1, 0, 1), (1, 0, 0), (0, 1, 1), (0, 1, 0), (0, 0, 1)
+    ]
+    assert list(generate_liaison_combinations(
+        [1, 0], [0, 1], min_removals=2)) == [(1, 1)]
+
+
+def test_generate_liaison_combinations_single_liaisons():
+    consecutive = [False, True, False]
+    assert list(generate_liaison_combinations(
+        [1, 1, 1], [0, 0, 0], consecutive=consecutive,
+        single_liaisons=True)) == [
+        (1, 0, 1), (1, 0, 0), (0, 1, 1), (0, 1, 0), (0, 0, 1), (0, 0, 0)
+    ]
+    assert list(generate_liaison_combinations(
+        [1, 1, 1], [0, 0, 0], consecutive=consecutive,
+        single_liaisons=False)) == [(1, 1, 1), (1, 1, 0)]
+
+
 def test_generate_liaison_positions_sinaeresis():
     syllables = [
         {'syllable': 'ha', 'is_stressed': False},
@@ -1058,6 +1243,16 @@ def test_get_stresses():
     assert (get_stresses(phonological_groups) == output)
 
 
+def test_adjust_stresses():
+    assert adjust_stresses([False, True], [False, True]) == [
+        False, True, False]
+    assert adjust_stresses([True, False, False], [False, False, True]) == [
+        True, False]
+    assert adjust_stresses(
+        [True, False, True, False, False], [False, True, False, False, True]
+    ) == [True, False, True, False]
+
+
 def test_get_rhythmical_pattern_proparoxytone():
     phonological_groups = [
         {'syllable': 'es', 'is_stressed': True},
@@ -1398,3 +1593,144 @@ def test_get_scansion_pos_output_mente(pos_output):
     que rápidamente vivió"""
     assert get_scansion(text, pos_output=True) == pos_output
     assert _get_scansion(text,  pos_output=True) == pos_output
+
+
+def test_get_scansion_batch():
+    texts = [
+        "Me gustas cuando callas porque estás como ausente,",
+        "Noche sin luna.\nLa tempestad estruja\nlos viejos cedros.",
+        "patata",
+    ]
+    output = [get_scansion(text, rhyme_analysis=True) for text in texts]
+    assert list(get_scansion_batch(
+        texts, rhyme_analysis=True, batch_size=2)) == output
+
+
+def test_get_scansion_batch_split_stanzas():
+    texts = [
+        "Noche sin luna.\n\nLa tempestad estruja\nlos viejos cedros.",
+        "patata",
+    ]
+    output = [get_scansion(text, split_stanzas_on="\n\n") for text in texts]
+    assert list(get_scansion_batch(
+        texts, split_stanzas_on="\n\n", batch_size=1)) == output
+
+
+def test_get_scansion_batch_max_length(monkeypatch, fake_nlp,
+                                       fake_get_scansion):
+    monkeypatch.setattr(rantanplan.core, "load_pipeline", lambda: fake_nlp)
+    monkeypatch.setattr(rantanplan.core, "_get_scansion", fake_get_scansion)
+    fake_nlp.max_length = 30
+    poem = "\n".join(["Noche sin luna.", "La tempestad estruja"] * 3)
+    texts = [poem, "patata", poem]
+    scansions = get_scansion_batch(texts, batch_size=2)
+    assert [scansion[0]["text"] for scansion in scansions] == texts
+    stanzas = ["Noche sin luna.", "La tempestad estruja"] * 2
+    scansions = get_scansion_batch(["patata", "\n\n".join(stanzas)],
+                                   split_stanzas_on="\n\n")
+    assert [[stanza[0]["text"] for stanza in scansion]
+            for scansion in scansions] == [["patata"], stanzas]
+    assert max(map(len, sum(fake_nlp.batches, []))) <= 30
+
+
+def test_tag_texts():
+    nlp = spacy.blank("es")
+    texts = ["uno dos\ntres\n\ncuatro", "", "cinco"]
+    stanzas = list(tag_texts(texts, chunk_size=8, nlp=nlp))
+    assert [[[record.text for record in stanza] for stanza in text]
+            for text in stanzas] == [
+        [["uno", "dos", "\n", "tres", "\n\n", "cuatro"]], [[]], [["cinco"]]]
+    stanzas = list(tag_texts(texts, "\n\n", chunk_size=8, nlp=nlp))
+    assert [[[record.text for record in stanza] for stanza in text]
+            for text in stanzas] == [
+        [["uno", "dos", "\n", "tres"], ["cuatro"]], [[]], [["cinco"]]]
+
+
+def test_get_stanzas():
+    doc = spacy.blank("es")("uno dos\n\ntres\n\n\ncuatro")
+    stanzas = get_stanzas(doc, "\n\n+")
+    assert [[token.text for token in stanza] for stanza in stanzas] == [
+        ["uno", "dos"], ["tres"], ["cuatro"]]
+    records = get_token_records(doc)
+    assert get_stanzas(records, "\n\n+") == [
+        records[:2], records[3:4], records[5:]]
+    with pytest.raises(ValueError):
+        get_stanzas(records, "\n\n")
+
+
+def test_get_stanzas_inside_token():
+    nlp = spacy.blank("es")
+    doc = nlp("uno\n\n\ndos")
+    stanzas = get_stanzas(doc, "\n\n", nlp)
+    assert [stanza.text for stanza in stanzas] == ["uno", "\ndos"]
+
+
+def test_tag_stanzas():
+    nlp = spacy.blank("es")
+    docs = [nlp("uno dos\n\ntres"), nlp("cuatro\n\n\ncinco")]
+    stanzas = list(tag_stanzas(docs, "\n\n", nlp))
+    assert all(isinstance(record, TokenRecord)
+               for stanza in stanzas for record in stanza)
+    assert [[record.text for record in stanza] for stanza in stanzas] == [
+        ["uno", "dos"], ["tres"], ["cuatro"], ["\n", "cinco"]]
+
+
+def test_get_token_lines():
+    doc = spacy.blank("es")("\nuno dos\ntres\n\n")
+    for token in doc:
+        token.pos_ = "SPACE" if token.is_space else "NOUN"
+    assert [[token.text for token in line]
+            for line in get_token_lines(doc)] == [
+        ["\n", "uno", "dos"], ["tres"]]
+
+
+def test_tag_lines():
+    doc = spacy.blank("es")("uno\ndos tres")
+    for token in doc:
+        token.pos_ = "SPACE" if token.is_space else "NOUN"
+    lines = list(tag_lines(doc))
+    assert all(isinstance(record, TokenRecord)
+               for line in lines for record in line)
+    assert [[(record.text, record.pos_, record.whitespace_)
+             for record in line] for line in lines] == [
+        [("uno", "NOUN", "")], [("dos", "NOUN", " "), ("tres", "NOUN", "")]]
+
+
+def test_iter_text_chunks():
+    text = "  uno dos\ntres\n\n  cuatro\ncinco"
+    assert list(iter_text_chunks(text, 11)) == [
+        "  uno dos\n", "tres\n\n  ", "cuatro\n", "cinco"]
+    assert list(iter_text_chunks(text, 12)) == [
+        "  uno dos\n", "tres\n\n  ", "cuatro\ncinco"]
+    assert list(iter_text_chunks(text, 20)) == [
+        "  uno dos\ntres\n\n  ", "cuatro\ncinco"]
+    assert list(iter_text_chunks(text, 100)) == [text]
+    assert list(iter_text_chunks(text, 12, "\n\n")) == [
+        "  uno dos\ntres", "  cuatro\ncinco"]
+    assert list(iter_text_chunks("\n\nuno", 1, "\n\n")) == ["", "uno"]
+
+
+def test_get_scansion_chunk_size():
+    text = "Noche sin luna.\nLa tempestad estruja\nlos viejos cedros."
+    assert get_scansion(text, rhyme_analysis=True, chunk_size=20) == (
+        get_scansion(text, rhyme_analysis=True))
+    text = "\n\n".join([text, "patata", text])
+    assert get_scansion(text, split_stanzas_on="\n\n", chunk_size=20) == (
+        get_scansion(text, split_stanzas_on="\n\n"))
+
+
+def test_iter_scansion():
+    text = "Noche sin luna.\nLa tempestad estruja\nlos viejos cedros."
+    lines = iter_scansion(text, rhythmical_lengths=[5, 7, 5], chunk_size=20)
+    assert next(lines) == get_scansion("Noche sin luna.",
+                                       rhythmical_lengths=[5])[0]
+    assert [next(lines)] + list(lines) == get_scansion(
+        text, rhythmical_lengths=[5, 7, 5])[1:]
+
+
+def test_get_scansion_max_liaison_candidates():
+    text = "el perro hace aguas"
+    scansion = get_scansion(text)
+    assert get_scansion(text, rhythmical_lengths=[7]) != scansion
+    assert get_scansion(text, rhythmical_lengths=[7],
+                        max_liaison_candidates=0) == scansion
@@ -0,0 +1,125 @@
+import json
+import os
+import threading
+from contextlib import contextmanager
+from unittest import mock
+
+import pytest
+
+from rantanplan.core import get_scansion
+from rantanplan.daemon import get_default_socket_path
+from rantanplan.daemon import get_scansion_remote
+from rantanplan.daemon import make_server
+
+
+@contextmanager
+def run_server(path):
+    server = make_server(path)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield path
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def socket_path(tmp_path, fake_nlp, fake_get_scansion):
+    fake_nlp.delay = 0.05
+    with mock.patch("rantanplan.daemon.load_pipeline",
+                    return_value=fake_nlp), \
+            mock.patch("rantanplan.core._get_scansion",
+                       fake_get_scansion), \
+            run_server(str(tmp_path / "rantanplan.sock")) as path:
+        yield path
+
+
+def test_get_scansion_remote(socket_path):
+    scansions = get_scansion_remote(["uno", "dos"], socket_path,
+                                    rhyme_analysis=True)
+    assert list(scansions) == [
+        [{"text": "uno", "options": {"rhyme_analysis": True}}],
+        [{"text": "dos", "options": {"rhyme_analysis": True}}],
+    ]
+
+
+def test_get_scansion_remote_error(socket_path):
+    with pytest.raises(RuntimeError, match="ValueError: scansion failed"):
+        list(get_scansion_remote(["uno", "error"], socket_path))
+
+
+def test_get_scansion_remote_no_daemon(tmp_path):
+    path = str(tmp_path / "rantanplan.sock")
+    with pytest.raises(ConnectionError, match="No daemon is listening"):
+        list(get_scansion_remote(["uno"], path))
+    make_server(path).server_close()
+    with pytest.raises(ConnectionError, match="No daemon is listening"):
+        list(get_scansion_remote(["uno"], path))
+
+
+def test_get_scansion_remote_split_stanzas(socket_path):
+    scansions = get_scansion_remote(["uno\n\ndos"], socket_path,
+                                    split_stanzas_on="\n\n")
+    options = {"split_stanzas_on": "\n\n"}
+    assert list(scansions) == [[[{"text": "uno", "options": options}],
+                                [{"text": "dos", "options": options}]]]
+
+
+def test_get_scansion_remote_serial_tagging(socket_path, fake_nlp):
+    def scan(text):
+        scansions[text] = list(get_scansion_remote([text], socket_path))
+
+    scansions = {}
+    clients = [threading.Thread(target=scan, args=(text, ))
+               for text in ("uno", "dos", "tres", "cuatro")]
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    assert scansions["tres"] == [[{"text": "tres", "options": {}}]]
+    assert len(scansions) == 4
+    assert not fake_nlp.overlapped
+
+
+def test_get_scansion_remote_pipeline(tmp_path):
+    text = "Noche sin luna.\nLa tempestad estruja\nlos viejos cedros."
+    poem = f"{text}\n\nMe gustas cuando callas\nporque estás como ausente"
+    with run_server(str(tmp_path / "rantanplan.sock")) as path:
+        scansions = list(get_scansion_remote([text], path,
+                                             rhyme_analysis=True))
+        stanzas = list(get_scansion_remote([poem], path,
+                                           split_stanzas_on="\n\n"))
+    # Compared as sent over the socket
+    assert scansions == [json.loads(json.dumps(
+        get_scansion(text, rhyme_analysis=True)))]
+    assert stanzas == [json.loads(json.dumps(
+        get_scansion(poem, split_stanzas_on="\n\n")))]
+
+
+def test_make_server_stale_socket(tmp_path):
+    path = tmp_path / "rantanplan.sock"
+    make_server(str(path)).server_close()
+    server = make_server(str(path))
+    assert path.is_socket()
+    server.server_close()
+
+
+def test_make_server_not_socket(tmp_path):
+    path = tmp_path / "rantanplan.sock"
+    path.write_text("")
+    with pytest.raises(FileExistsError, match="is not a socket"):
+        make_server(str(path))
+    assert path.read_text() == ""
+
+
+def test_make_server_listening(socket_path):
+    with pytest.raises(FileExistsError, match="already listening"):
+        make_server(socket_path)
+
+
+def test_get_default_socket_path(monkeypatch):
+    monkeypatch.setenv("XDG_RUNTIME_DIR", "/run/user/1000")
+    assert get_default_socket_path() == "/run/user/1000/rantanplan.sock"
+    monkeypatch.delenv("XDG_RUNTIME_DIR")
+    assert str(os.getuid()) in get_default_socket_path()
@@ -0,0 +1,106 @@
+import gc
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import spacy
+
+from rantanplan.core import get_scansion
+from rantanplan.parallel import get_memory_info
+from rantanplan.parallel import scan_corpus
+from rantanplan.parallel import scan_corpus_staged
+from rantanplan.parallel import scan_poem
+from rantanplan.parallel import shard_texts
+from rantanplan.records import get_token_records
+
+
+def test_shard_texts():
+    texts = ["a" * 3, "b" * 4, "c" * 2, "d" * 6, "e"]
+    output = [["aaa", "bbbb"], ["cc", "dddddd"], ["e"]]
+    assert list(shard_texts(texts, shard_size=5)) == output
+
+
+def test_shard_texts_empty():
+    assert list(shard_texts([])) == []
+
+
+def test_scan_corpus():
+    texts = [
+        "Noche sin luna.\nLa tempestad estruja\nlos viejos cedros.",
+        "patata",
+        "Me gustas cuando callas porque estás como ausente,",
+    ]
+    output = [get_scansion(text, rhyme_analysis=True) for text in texts]
+    assert list(scan_corpus(texts, rhyme_analysis=True, workers=2,
+                            shard_size=1, max_pending_shards=1)) == output
+
+
+def test_scan_corpus_preload():
+    texts = ["Noche sin luna.", "patata", "La tempestad estruja"]
+    output = [get_scansion(text) for text in texts]
+    memory_report = {}
+    assert list(scan_corpus(texts, workers=2, shard_size=1, preload=True,
+                            memory_report=memory_report)) == output
+    assert 1 <= len(memory_report) <= 2
+    for pid, memory in memory_report.items():
+        assert memory["pid"] == pid
+    assert gc.get_freeze_count() == 0
+
+
+def test_scan_corpus_max_length(monkeypatch, fake_nlp, fake_get_scansion):
+    for module in ("rantanplan.core", "rantanplan.parallel"):
+        monkeypatch.setattr(f"{module}.load_pipeline", lambda: fake_nlp)
+    monkeypatch.setattr("rantanplan.core._get_scansion", fake_get_scansion)
+    fake_nlp.max_length = 30
+    poem = "\n".join(["Noche sin luna.", "La tempestad estruja"] * 3)
+    texts = [poem, "patata", poem]
+    scansions = scan_corpus(texts, workers=2, shard_size=1)
+    assert [scansion[0]["text"] for scansion in scansions] == texts
+    scansions = scan_corpus_staged(texts, scansion_workers=2, chunk_size=20)
+    assert [scansion[0]["text"] for scansion in scansions] == texts
+
+
+def test_scan_corpus_staged():
+    texts = [
+        "Noche sin luna.\nLa tempestad estruja\nlos viejos cedros.",
+        "patata",
+        "Me gustas cuando callas porque estás como ausente,",
+    ]
+    output = [get_scansion(text, rhyme_analysis=True) for text in texts]
+    assert list(scan_corpus_staged(texts, rhyme_analysis=True,
+                                   tagging_workers=1, scansion_workers=2,
+                                   queue_size=1, batch_size=2)) == output
+
+
+def test_scan_corpus_staged_error():
+    with pytest.raises(RuntimeError, match="TypeError"):
+        list(scan_corpus_staged(["patata", None], scansion_workers=1))
+
+
+def test_scan_poem():
+    text = "\n\n".join([
+        "Noche sin luna.\nLa tempestad estruja\nlos viejos cedros.",
+        "Me gustas cuando callas\nporque estás como ausente",
+        "patata",
+    ] * 3)
+    records = get_token_records(spacy.blank("es")(text))
+    output = get_scansion(records, split_stanzas_on="\n\n")
+    assert scan_poem(records, workers=2, stanzas_per_task=2) == output
+    with ThreadPoolExecutor(2) as executor:
+        assert scan_poem(records, executor=executor) == output
+
+
+def test_scan_poem_chunks():
+    text = "\n\n".join([
+        "Noche sin luna.\nLa tempestad estruja\nlos viejos cedros.",
+        "Me gustas cuando callas\nporque estás como ausente",
+    ] * 3)
+    output = get_scansion(text, split_stanzas_on="\n\n")
+    with ThreadPoolExecutor(2) as executor:
+        assert scan_poem(text, executor=executor, chunk_size=60) == output
+
+
+def test_get_memory_info():
+    memory = get_memory_info()
+    assert set(memory) == {"pid", "rss", "pss", "uss"}
+    if memory["rss"] is not None:
+        assert 0 < memory["uss"] <= memory["rss"]
@@ -1,6 +1,23 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy
+import pytest
 import spacy
 
+import rantanplan.pipeline
+from rantanplan.core import get_scansion
+from rantanplan.pipeline import evict_pipeline
+from rantanplan.pipeline import get_pipeline_key
+from rantanplan.pipeline import get_snapshot_key
 from rantanplan.pipeline import load_pipeline
+from rantanplan.pipeline import pipelines_info
+from rantanplan.pipeline import remove_unused_vectors
+from rantanplan.pipeline import save_pipeline_snapshot
+from rantanplan.pipeline import set_default_profile
+from rantanplan.pipeline import set_default_snapshot
+from rantanplan.pipeline import set_pipelines_max_size
 
 test_dict_list = [
     {'text': 'prue', 'pos_': '', 'tag_': '',
@@ -47,3 +64,163 @@ def test_load_pipeline_affixes(monkeypatch):
             {"text": token.text, "pos_": token.pos_, "tag_": token.tag_,
             "n_rights": token.n_rights})  # noqa
     assert token_dict == test_dict_list
+
+
+@pytest.fixture
+def built_pipelines(monkeypatch):
+    built = []
+
+    def mockbuild(lang, split_affixes=True, disable=None):
+        time.sleep(0.05)
+        built.append((lang, split_affixes, disable))
+        return object()
+
+    monkeypatch.setattr(rantanplan.pipeline, 'build_pipeline', mockbuild)
+    monkeypatch.setattr(rantanplan.pipeline, '_pipelines', OrderedDict())
+    monkeypatch.setattr(rantanplan.pipeline, '_pipelines_memory', {})
+    yield built
+    set_pipelines_max_size(None)
+
+
+def test_get_pipeline_key():
+    assert get_pipeline_key() == ('es_core_news_md', True, ())
+    assert get_pipeline_key("es", 0, ["parser", "ner"]) == (
+        "es", False, ("ner", "parser"))
+    assert get_pipeline_key("es", disable=["parser"], profile="slim") == (
+        "es", True, ("ner", "parser", "vectors"))
+    with pytest.raises(ValueError):
+        get_pipeline_key(profile="tiny")
+
+
+def test_set_default_profile():
+    set_default_profile("slim")
+    assert get_pipeline_key() == (
+        'es_core_news_md', True, ("ner", "parser", "vectors"))
+    assert get_pipeline_key(profile="full") == ('es_core_news_md', True, ())
+    set_default_profile("full")
+    assert get_pipeline_key() == ('es_core_news_md', True, ())
+
+
+def test_remove_unused_vectors():
+    nlp = spacy.blank('es')
+    nlp.vocab.set_vector("verso", numpy.ones(10, dtype="f"))
+    tagger = nlp.create_pipe("tagger")
+    nlp.add_pipe(tagger)
+    tagger.cfg["pretrained_vectors"] = "es_vectors"
+    assert not remove_unused_vectors(nlp)
+    assert nlp.vocab.vectors.shape[1] == 10
+    del tagger.cfg["pretrained_vectors"]
+    assert remove_unused_vectors(nlp)
+    assert nlp.vocab.vectors.shape[1] == 0
+
+
+def test_load_pipeline_threads(built_pipelines):
+    pipelines = []
+    threads = [
+        threading.Thread(
+            target=lambda: pipelines.append(load_pipeline("registry")))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert built_pipelines == [("registry", True, ())]
+    assert all(nlp is pipelines[0] for nlp in pipelines)
+
+
+def test_load_pipeline_variants(built_pipelines):
+    nlp = load_pipeline("registry")
+    assert load_pipeline("registry", split_affixes=False) is not nlp
+    assert load_pipeline("registry", disable=["ner"]) is not nlp
+    assert load_pipeline("registry") is nlp
+    assert len(built_pipelines) == 3
+    assert [(pipeline.split_affixes, pipeline.disable)
+            for pipeline in pipelines_info()] == [
+        (False, ()), (True, ("ner", )), (True, ())]
+
+
+def test_evict_pipeline(built_pipelines):
+    nlp = load_pipeline("registry")
+    assert evict_pipeline("registry")
+    assert not evict_pipeline("registry")
+    assert load_pipeline("registry") is not nlp
+
+
+def test_set_pipelines_max_size(built_pipelines):
+    set_pipelines_max_size(2)
+    load_pipeline("registry", disable=["ner"])
+    load_pipeline("registry", disable=["parser"])
+    load_pipeline("registry", disable=["ner"])
+    load_pipeline("registry")
+    assert [pipeline.disable for pipeline in pipelines_info()] == [
+        ("ner", ), ()]
+
+
+class FakeAffixesMatcher:
+    def __init__(self, nlp, rules=None, lexicon=None, split_on=None):
+        self.rules = rules
+        self.lexicon = lexicon
+        self.split_on = split_on
+
+    def __call__(self, doc):
+        return doc
+
+
+def test_pipeline_snapshot(tmp_path, monkeypatch):
+    def mockbuild(lang, split_affixes=True, disable=None):
+        nlp = spacy.blank('es')
+        nlp.tokenizer = rantanplan.pipeline.custom_tokenizer(nlp)
+        nlp.add_pipe(FakeAffixesMatcher(nlp, {"r": []}, {"w": []}, ["VERB"]),
+                     name="affixes", first=True)
+        return nlp
+
+    monkeypatch.setattr(rantanplan.pipeline, 'build_pipeline', mockbuild)
+    monkeypatch.setattr(rantanplan.pipeline, 'AffixesMatcher',
+                        FakeAffixesMatcher)
+    monkeypatch.setattr(rantanplan.pipeline, '_pipelines', OrderedDict())
+    monkeypatch.setattr(rantanplan.pipeline, '_pipelines_memory', {})
+    save_pipeline_snapshot(str(tmp_path), "snapshot", profile="slim")
+    built = load_pipeline("snapshot", profile="slim")
+    assert get_snapshot_key(str(tmp_path)) == (
+        "snapshot", True, ("ner", "parser", "vectors"))
+    evict_pipeline("snapshot", profile="slim")
+    restored = load_pipeline(snapshot=str(tmp_path))
+    assert restored is not built
+    assert load_pipeline("snapshot", profile="slim") is restored
+    assert restored.pipe_names == ["affixes"]
+    affixes = restored.get_pipe("affixes")
+    assert (affixes.rules, affixes.lexicon, affixes.split_on) == (
+        {"r": []}, {"w": []}, ["VERB"])
+    assert [token.text for token in restored("prue-\nba")] == [
+        token.text for token in built("prue-\nba")]
+
+
+def test_default_snapshot(tmp_path, monkeypatch):
+    def mockbuild(lang, split_affixes=True, disable=None):
+        built.append((lang, split_affixes, disable))
+        nlp = spacy.blank('es')
+        nlp.tokenizer = rantanplan.pipeline.custom_tokenizer(nlp)
+        return nlp
+
+    built = []
+    monkeypatch.setattr(rantanplan.pipeline, 'build_pipeline', mockbuild)
+    monkeypatch.setattr(rantanplan.pipeline, '_pipelines', OrderedDict())
+    monkeypatch.setattr(rantanplan.pipeline, '_pipelines_memory', {})
+    monkeypatch.setattr(rantanplan.pipeline, 'DEFAULT_SNAPSHOT', None)
+    save_pipeline_snapshot(str(tmp_path), split_affixes=False,
+                           disable=["ner"])
+    evict_pipeline(split_affixes=False, disable=["ner"])
+    set_default_snapshot(str(tmp_path))
+    restored = load_pipeline()
+    assert load_pipeline() is restored
+    assert load_pipeline(snapshot=str(tmp_path)) is restored
+    assert get_scansion("patata")[0]["rhythm"]["stress"] == "-+-"
+    assert [pipeline.split_affixes for pipeline in pipelines_info()] == [
+        False]
+    # Only the pipeline saved to the snapshot was built
+    assert built == [('es_core_news_md', False, ("ner", ))]
+    set_default_snapshot(None)
+    assert load_pipeline() is not restored
+    with pytest.raises(FileNotFoundError):
+        set_default_snapshot(str(tmp_path / "none"))
@@ -1,12 +1,177 @@
+import bz2
+import gzip
+import json
+import lzma
+from unittest import mock
 
 from click.testing import CliRunner
 
+from rantanplan.cli import iter_paths
+from rantanplan.cli import iter_poems
 from rantanplan.cli import main
+from rantanplan.cli import open_input
 
 
-def test_main():
+def test_iter_poems():
+    lines = ["uno\n", "dos\n", "---\n", "\n", "tres\n", "---\n", "---\n"]
+    assert list(iter_poems(lines, "---")) == ["uno\ndos", "tres"]
+    assert list(iter_poems(lines)) == ["uno\ndos\n---\n\ntres\n---\n---"]
+    assert list(iter_poems(["\n"])) == []
+
+
+def test_open_input(tmp_path):
+    for extension, opener in ((".gz", gzip.open), (".bz2", bz2.open),
+                              (".xz", lzma.open), (".txt", open)):
+        path = str(tmp_path / f"poem{extension}")
+        with opener(path, "wt", encoding="utf-8") as poem:
+            poem.write("canción\n")
+        with open_input(path) as poem:
+            assert poem.read() == "canción\n"
+
+
+def test_iter_paths(tmp_path):
+    (tmp_path / "b").mkdir()
+    for name in ("a.txt", "b/c.txt", "b/d.gz"):
+        (tmp_path / name).write_text("")
+    assert list(iter_paths([str(tmp_path)])) == [
+        str(tmp_path / name) for name in ("a.txt", "b/c.txt", "b/d.gz")
+    ]
+    assert list(iter_paths([str(tmp_path / "**" / "*.txt")])) == [
+        str(tmp_path / name) for name in ("a.txt", "b/c.txt")
+    ]
+    assert list(iter_paths([])) == ["-"]
+
+
+def test_main(monkeypatch, fake_get_scansion_batch):
+    monkeypatch.setattr("rantanplan.cli.get_scansion_batch",
+                        fake_get_scansion_batch)
+    runner = CliRunner()
+    result = runner.invoke(main, ["-d", "---", "--rhyme", "--batch-size", "2"],
+                           input="uno\n---\ndos\n")
+    assert result.exit_code == 0
+    assert [json.loads(line) for line in result.output.splitlines()] == [
+        {"source": "-", "index": index, "scansion": [{
+            "text": text,
+            "options": {"rhyme_analysis": True, "rhythm_format": "pattern",
+                        "split_stanzas_on": None, "batch_size": 2},
+        }]} for index, text in enumerate(["uno", "dos"])
+    ]
+
+
+def test_main_files(tmp_path, monkeypatch, fake_get_scansion_batch):
+    monkeypatch.setattr("rantanplan.cli.get_scansion_batch",
+                        fake_get_scansion_batch)
+    with gzip.open(str(tmp_path / "a.gz"), "wt", encoding="utf-8") as poem:
+        poem.write("uno\n")
+    (tmp_path / "b.txt").write_text("dos\n")
+    runner = CliRunner()
+    result = runner.invoke(main, [str(tmp_path / "*")])
+    assert result.exit_code == 0
+    assert [
+        (record["source"], record["scansion"][0]["text"])
+        for record in map(json.loads, result.output.splitlines())
+    ] == [(str(tmp_path / "a.gz"), "uno"), (str(tmp_path / "b.txt"), "dos")]
+
+
+def test_main_missing_path(monkeypatch, fake_get_scansion_batch):
+    monkeypatch.setattr("rantanplan.cli.get_scansion_batch",
+                        fake_get_scansion_batch)
+    runner = CliRunner()
+    result = runner.invoke(main, ["/nonexistent/*.txt"])
+    assert result.exit_code == 2
+
+
+@mock.patch("rantanplan.cli.get_scansion_remote")
+def test_main_socket(get_scansion_remote):
+    get_scansion_remote.side_effect = lambda texts, socket_path, **options: (
+        [{"text": text, "socket": socket_path}] for text in texts)
     runner = CliRunner()
-    result = runner.invoke(main, [])
+    result = runner.invoke(main, ["--socket", "rantanplan.sock"],
+                           input="uno\n")
+    assert result.exit_code == 0
+    assert json.loads(result.output)["scansion"] == [
+        {"text": "uno", "socket": "rantanplan.sock"}]
+
+
+def test_main_socket_no_daemon(tmp_path):
+    runner = CliRunner()
+    result = runner.invoke(main, ["--socket", str(tmp_path / "none.sock")],
+                           input="uno\n")
+    assert result.exit_code == 1
+    assert "No daemon is listening" in result.output
+
 
-    assert result.output == '()\n'
+def test_main_ignored_options():
+    runner = CliRunner()
+    for arguments, message in [
+        (["--conllu", "--socket", "rantanplan.sock"], "used together"),
+        (["--conllu", "--workers", "2"], "--workers can not be used"),
+        (["--socket", "rantanplan.sock", "--batch-size", "10",
+          "--tagging-workers", "2"], "--tagging-workers, --batch-size"),
+        (["--conllu", "-d", "---"], "--delimiter can not be used"),
+        (["--preload"], "need more than one --workers"),
+        (["--workers", "2", "--tagging-workers", "1", "--report-memory"],
+         "need more than one --workers"),
+    ]:
+        result = runner.invoke(main, arguments, input="uno\n")
+        assert result.exit_code == 2
+        assert message in result.output
+
+
+def test_main_help():
+    runner = CliRunner()
+    result = runner.invoke(main, ["--help"])
+    assert result.exit_code == 0
+    assert "scan" in result.output and "serve" in result.output
+
+
+@mock.patch("rantanplan.cli.save_pipeline_snapshot")
+def test_snapshot(save_pipeline_snapshot):
+    runner = CliRunner()
+    result = runner.invoke(main, ["snapshot", "pipeline", "--profile", "slim"])
+    assert result.exit_code == 0
+    save_pipeline_snapshot.assert_called_once_with(
+        "pipeline", split_affixes=True, profile="slim")
+
+
+@mock.patch("rantanplan.cli.scan_corpus")
+def test_main_workers(scan_corpus):
+    def fake_scan_corpus(texts, memory_report=None, **options):
+        memory_report[1] = {"pid": 1, "rss": 2, "pss": 1, "uss": 1}
+        return ([{"text": text}] for text in texts)
+
+    scan_corpus.side_effect = fake_scan_corpus
+    runner = CliRunner()
+    result = runner.invoke(main, ["--workers", "2", "--preload",
+                                  "--report-memory"], input="uno\n")
+    assert result.exit_code == 0
+    assert scan_corpus.call_args[1]["preload"]
+    records = sorted(map(json.loads, result.output.splitlines()), key=len)
+    assert records == [
+        {"source": "-", "index": 0, "scansion": [{"text": "uno"}]},
+        {"pid": 1, "rss": 2, "pss": 1, "uss": 1},
+    ]
+
+
+@mock.patch("rantanplan.cli.scan_corpus_staged")
+def test_main_tagging_workers(scan_corpus_staged, fake_get_scansion_batch):
+    scan_corpus_staged.side_effect = fake_get_scansion_batch
+    runner = CliRunner()
+    result = runner.invoke(main, ["--workers", "3", "--tagging-workers", "2"],
+                           input="uno\n")
+    assert result.exit_code == 0
+    assert scan_corpus_staged.call_args[1]["tagging_workers"] == 2
+    assert scan_corpus_staged.call_args[1]["scansion_workers"] == 3
+    assert json.loads(result.output)["scansion"][0]["text"] == "uno"
+
+
+def test_main_conllu():
+    conllu = ("1\tpatata\tpatata\tNOUN\t_\t_\t0\troot\t_\t_\n\n"
+              "# newdoc\n"
+              "1\tluna\tluna\tNOUN\t_\t_\t0\troot\t_\t_\n")
+    runner = CliRunner()
+    result = runner.invoke(main, ["--conllu"], input=conllu)
     assert result.exit_code == 0
+    records = [json.loads(line) for line in result.output.splitlines()]
+    assert [record["index"] for record in records] == [0, 1]
+    assert records[1]["scansion"][0]["rhythm"]["length"] == 2
@@ -0,0 +1,123 @@
+import pickle
+
+import pytest
+import spacy
+from spacy.tokens import Token
+
+from rantanplan.core import get_scansion
+from rantanplan.records import TokenRecord
+from rantanplan.records import get_token_records
+from rantanplan.records import read_conllu
+
+
+def test_token_record():
+    record = TokenRecord("Cantaba", "VERB", "VERB__Mood=Ind", 2, " ")
+    assert record.orth_ == "Cantaba"
+    assert record.is_alpha
+    assert record._.affixes_length == 2
+    assert not TokenRecord("\n", "SPACE", "", None, "").is_alpha
+    assert pickle.loads(pickle.dumps(record)) == record
+
+
+@pytest.fixture
+def affixes_length():
+    # Registered only for the test, or building the affixes matcher of a
+    # pipeline later fails because the extension already exists
+    registered = Token.has_extension("affixes_length")
+    if not registered:
+        Token.set_extension("affixes_length", default=0)
+    yield
+    if not registered:
+        Token.remove_extension("affixes_length")
+
+
+def test_get_token_records(affixes_length):
+    doc = spacy.blank("es")("Noche sin luna.")
+    doc[0].pos_ = "NOUN"
+    records = get_token_records(doc)
+    assert [record.text for record in records] == [
+        "Noche", "sin", "luna", "."]
+    assert records[0] == TokenRecord("Noche", "NOUN", "", 0, " ")
+    assert records[-1].whitespace_ == ""
+
+
+CONLLU = """\
+# newdoc
+# text = Dámelo todo, del mar
+1-3	Dámelo	_	_	_	_	_	_	_	_
+1	Da	dar	VERB	_	Mood=Imp|Number=Sing|Person=2	0	root	_	_
+2	me	yo	PRON	_	Case=Dat	1	obj	_	_
+3	lo	él	PRON	_	Case=Acc	1	obj	_	_
+4	todo	todo	PRON	_	_	1	obj	_	SpaceAfter=No
+5	,	,	PUNCT	_	_	1	punct	_	_
+6-7	del	_	_	_	_	_	_	_	_
+6	de	de	ADP	_	_	8	case	_	_
+7	el	el	DET	_	_	8	det	_	_
+8	mar	mar	NOUN	_	_	1	obl	_	SpacesAfter=\\n
+
+# text = y vámonos.
+1	y	y	CCONJ	_	_	2	cc	_	_
+2-3	vámonos	_	_	_	_	_	_	_	SpaceAfter=No
+2	vamos	ir	VERB	_	_	0	root	_	_
+3	nos	nosotros	PRON	_	_	2	obj	_	_
+4	.	.	PUNCT	_	_	2	punct	_	SpacesAfter=\\n
+
+# newdoc id = poem2
+1	patata	patata	NOUN	_	_	0	root	_	_
+"""
+
+
+def test_read_conllu():
+    first, second = read_conllu(CONLLU.splitlines(True))
+    assert first == [
+        TokenRecord("Dá", "VERB", "Mood=Imp|Number=Sing|Person=2", 2, ""),
+        TokenRecord("me", "PRON", "Case=Dat", None, ""),
+        TokenRecord("lo", "PRON", "Case=Acc", None, " "),
+        TokenRecord("todo", "PRON", "", None, ""),
+        TokenRecord(",", "PUNCT", "", None, " "),
+        TokenRecord("del", "ADP", "", None, " "),
+        TokenRecord("mar", "NOUN", "", None, ""),
+        TokenRecord("\n", "SPACE", "_SP", None, ""),
+        TokenRecord("y", "CCONJ", "", None, " "),
+        TokenRecord("vámo", "VERB", "", 1, ""),
+        TokenRecord("nos", "PRON", "", None, ""),
+        TokenRecord(".", "PUNCT", "", None, ""),
+    ]
+    assert second == [TokenRecord("patata", "NOUN", "", None, " ")]
+
+
+def test_read_conllu_newdoc_id():
+    lines = ["# newdoc id = poem1\n",
+             "1\tluna\tluna\tNOUN\t_\t_\t0\troot\t_\t_\n",
+             "\n",
+             "# newdoc id = poem2\n",
+             "1\tpatata\tpatata\tNOUN\t_\t_\t0\troot\t_\t_\n",
+             "# newdocument = not a document\n",
+             "2\tsol\tsol\tNOUN\t_\t_\t1\tnmod\t_\t_\n"]
+    assert list(read_conllu(lines)) == [
+        [TokenRecord("luna", "NOUN", "", None, " ")],
+        [TokenRecord("patata", "NOUN", "", None, " "),
+         TokenRecord("sol", "NOUN", "", None, " ")],
+    ]
+
+
+def test_read_conllu_sentence_lines():
+    lines = [line for line in CONLLU.splitlines(True)
+             if "newdoc" not in line]
+    lines = [line.replace("SpacesAfter=\\n", "_") for line in lines]
+    records = next(read_conllu(lines))
+    newline = TokenRecord("\n", "SPACE", "_SP", None, "")
+    assert next(read_conllu(lines, sentence_lines=True)) == (
+        records[:7] + [newline] + records[7:11] + [newline] + records[11:])
+    assert "SPACE" not in [record.pos_ for record in records]
+
+
+def test_get_scansion_conllu():
+    records = next(read_conllu(CONLLU.splitlines(True)))
+    scansion = get_scansion(records)
+    assert len(scansion) == 2
+    assert [token.get("symbol") for token in scansion[1]["tokens"]] == [
+        None, None, "."]
+    assert [syllable["syllable"]
+            for syllable in scansion[1]["tokens"][1]["word"]] == [
+        "vá", "mo", "nos"]
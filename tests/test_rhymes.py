@@ -8,14 +8,17 @@ from rantanplan.core import get_scansion
 from rantanplan.rhymes import analyze_rhyme
 from rantanplan.rhymes import apply_offset
 from rantanplan.rhymes import assign_letter_codes
+from rantanplan.rhymes import compile_structures
 from rantanplan.rhymes import get_best_rhyme_candidate
 from rantanplan.rhymes import get_clean_codes
 from rantanplan.rhymes import get_ending_with_liaison
+from rantanplan.rhymes import get_matching_structures
 from rantanplan.rhymes import get_rhymes
 from rantanplan.rhymes import get_stressed_endings
 from rantanplan.rhymes import rhyme_codes_to_letters
 from rantanplan.rhymes import search_structure
 from rantanplan.rhymes import split_stress
+from rantanplan.structures import STRUCTURES
 
 
 @pytest.fixture
@@ -457,6 +460,41 @@ def test_search_structure():
     assert search_structure(rhymes, ranges_list, key) == [50]
 
 
+def test_get_matching_structures():
+    assert 50 in get_matching_structures("-a-a", "assonant")
+    assert all(STRUCTURES[index][0] == "consonant"
+               for index in get_matching_structures("abba", "consonant"))
+    assert get_matching_structures("abba", "unknown") == ()
+
+
+def test_search_structure_first_match():
+    structures = (
+        ("assonant", "first", r"-a-a", lambda _: True),
+        ("consonant", "second", r"-a-a", lambda _: True),
+        ("assonant", "third", lambda rhyme: rhyme.endswith("a"),
+         lambda _: True),
+    )
+    ranges_list = [range(8, 9)] * 4
+    assert search_structure(
+        "-a-a", ranges_list, "assonant", structures) == [0, 2]
+    assert search_structure(
+        "-a-a", ranges_list, "assonant", structures, first_match=True) == [0]
+    assert search_structure(
+        "-a-a", ranges_list, "consonant", structures) == [1]
+
+
+def test_compile_structures():
+    structures = (
+        ("assonant", "first", r"a  a", lambda _: True),
+        ("consonant", "second", r".*", lambda _: True),
+    )
+    compiled_structures = compile_structures(structures)
+    assert sorted(compiled_structures) == ["assonant", "consonant"]
+    index, structure_check, _ = compiled_structures["assonant"][0]
+    assert index == 0
+    assert structure_check("aa")
+
+
 def test_analyze_rhyme_haiku(rhyme_analysis_haiku):
     """
     Noche sin luna.
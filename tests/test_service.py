@@ -0,0 +1,181 @@
+import asyncio
+import json
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import pytest
+
+from rantanplan.core import get_scansion
+from rantanplan.service import ScansionService
+from rantanplan.service import make_worker_pool
+from rantanplan.service import percentile
+
+
+@pytest.fixture
+def service(fake_nlp, fake_get_scansion):
+    with mock.patch("rantanplan.service.load_pipeline",
+                    return_value=fake_nlp), \
+            mock.patch("rantanplan.core._get_scansion",
+                       fake_get_scansion):
+        yield ScansionService(max_batch_size=3, max_wait_ms=50)
+
+
+async def request(port, method, path, content=None):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    body = b"" if content is None else json.dumps(content).encode()
+    writer.write(f"{method} {path} HTTP/1.1\r\nConnection: close\r\n"
+                 f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b"\r\n\r\n")
+    return int(head.split()[1]), json.loads(body)
+
+
+def run_service(service, *requests):
+    async def run():
+        server = await service.start(port=0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            return await asyncio.gather(*(
+                request(port, *arguments) for arguments in requests))
+        finally:
+            await service.close()
+
+    return asyncio.run(run())
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([3], 95) == 3
+    assert percentile([], 50) is None
+
+
+def test_service_micro_batching(service):
+    texts = ["uno", "dos", "tres", "cuatro"]
+    responses = run_service(service, *(
+        ("POST", "/scansion", {"text": text}) for text in texts))
+    assert responses == [
+        (200, [{"text": text, "options": {}}]) for text in texts]
+    assert sorted(map(len, service.nlp.batches)) == [1, 3]
+
+
+def test_service_split_stanzas(service):
+    responses = run_service(service, ("POST", "/scansion", {
+        "text": "uno\n\ndos", "options": {"split_stanzas_on": "\n\n"}}))
+    options = {"split_stanzas_on": "\n\n"}
+    assert responses == [(200, [[{"text": "uno", "options": options}],
+                                [{"text": "dos", "options": options}]])]
+
+
+def test_service_max_length(service):
+    service.nlp.max_length = 30
+    poem = "\n".join(["Noche sin luna.", "La tempestad estruja"] * 3)
+    stanzas = "\n\n".join(["Noche sin luna.", "La tempestad estruja"] * 2)
+    options = {"split_stanzas_on": "\n\n"}
+    responses = run_service(
+        service,
+        ("POST", "/scansion", {"text": poem}),
+        ("POST", "/scansion", {"text": stanzas, "options": options}),
+    )
+    assert responses[0] == (200, [{"text": poem, "options": {}}])
+    assert responses[1] == (200, [
+        [{"text": stanza, "options": options}]
+        for stanza in ["Noche sin luna.", "La tempestad estruja"] * 2])
+    assert max(map(len, sum(service.nlp.batches, []))) <= 30
+
+
+def test_service_process_pool(fake_nlp, fake_get_scansion):
+    options = {"split_stanzas_on": "\n\n"}
+    with mock.patch("rantanplan.service.load_pipeline",
+                    return_value=fake_nlp), \
+            mock.patch("rantanplan.core._get_scansion",
+                       fake_get_scansion):
+        with make_worker_pool(2, processes=True) as executor:
+            service = ScansionService(executor=executor)
+            responses = run_service(service, ("POST", "/scansion", {
+                "text": "uno\n\ndos", "options": options}))
+    assert responses == [(200, [[{"text": "uno", "options": options}],
+                                [{"text": "dos", "options": options}]])]
+
+
+def test_service_pipeline():
+    text = "Noche sin luna.\nLa tempestad estruja\nlos viejos cedros."
+    poem = f"{text}\n\nMe gustas cuando callas\nporque estás como ausente"
+    stanzas = {"split_stanzas_on": "\n\n"}
+    with make_worker_pool(2, processes=True) as executor:
+        responses = run_service(
+            ScansionService(executor=executor),
+            ("POST", "/scansion", {"text": text,
+                                   "options": {"rhyme_analysis": True}}),
+            ("POST", "/scansion", {"text": poem, "options": stanzas}),
+        )
+    # Compared as sent over HTTP
+    assert responses == [
+        (200, json.loads(json.dumps(get_scansion(text, rhyme_analysis=True)))),
+        (200, json.loads(json.dumps(get_scansion(poem, **stanzas)))),
+    ]
+
+
+def test_make_worker_pool():
+    with make_worker_pool(2) as executor:
+        assert isinstance(executor, ThreadPoolExecutor)
+    with make_worker_pool(2, processes=True) as executor:
+        assert isinstance(executor, ProcessPoolExecutor)
+        # Started before serving so they hold no connections open
+        assert len(executor._processes) == 2
+
+
+def test_service_errors(service):
+    responses = run_service(
+        service,
+        ("POST", "/scansion", {"text": "error"}),
+        ("POST", "/scansion", {"text": "uno", "options": {"unknown": 1}}),
+        ("POST", "/scansion", {"text": "uno",
+                               "options": {"split_stanzas_on": "("}}),
+        ("POST", "/scansion", {}),
+        ("GET", "/scansion"),
+        ("GET", "/unknown"),
+    )
+    assert [status for status, _ in responses] == [
+        500, 400, 400, 400, 405, 404]
+    assert responses[0][1] == {"error": "ValueError: scansion failed"}
+
+
+def test_service_metrics(service):
+    responses = run_service(
+        service,
+        ("POST", "/scansion", {"text": "uno"}),
+        ("POST", "/scansion", {"text": "dos"}),
+    )
+    assert [status for status, _ in responses] == [200, 200]
+    latency, queue = run_service(
+        service,
+        ("GET", "/metrics/latency"),
+        ("GET", "/metrics/queue"),
+    )
+    assert latency[1]["count"] == 2
+    assert latency[1]["p50"] <= latency[1]["p95"] <= latency[1]["p99"]
+    assert queue[1] == {"queue_depth": 0, "pending": 0}
+
+
+def test_service_tag_error(service):
+    def fake_get_stanzas(doc, split_stanzas_on, nlp):
+        if doc.text == "error":
+            raise ValueError("split failed")
+        return [doc]
+
+    options = {"split_stanzas_on": "\n\n"}
+    with mock.patch("rantanplan.core.get_stanzas", fake_get_stanzas):
+        responses = run_service(
+            service,
+            ("POST", "/scansion", {"text": "error", "options": options}),
+            ("POST", "/scansion", {"text": "uno", "options": options}),
+        )
+    assert responses == [
+        (500, {"error": "ValueError: split failed"}),
+        (200, [[{"text": "uno", "options": options}]]),
+    ]
+    assert service.nlp.batches == [["error", "uno"]]